@@ -7,46 +7,47 @@ from database.models import ContentSource
 logger = logging.getLogger(__name__)
 
 class ContentAnalyzer:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, client: OpenAI = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = client or OpenAI(api_key=self.api_key)
         self.model = "gpt-4-turbo-preview" # Or gpt-3.5-turbo if preferred for cost
 
     def score_content(self, content: ContentSource) -> float:
-        """Оценить контент на релевантность (0-100)"""
-        try:
-            prompt = f"""
+        """
+        Оценить контент на релевантность (0-100).
+        Ошибки API и неразборчивый ответ пробрасываются: вызывающий код вернет
+        элемент в очередь, а не запишет ему 0.
+        """
+        prompt = f"""
 Оцени этот контент на релевантность для менеджеров Wildberries и инвесторов в маркетплейсы.
 Ответь ТОЛЬКО ЧИСЛО от 0 до 100.
 
 Контент:
 Caption: {content.caption[:300] if content.caption else 'No caption'}
-Likes: {content.metadata_info.get('likes')}
-Views: {content.metadata_info.get('views')}
-Author: {content.metadata_info.get('author')}
+Likes: {content.likes}
+Views: {content.views}
+Author: {content.author}
 """
+        try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=10
             )
-            
-            response_text = response.choices[0].message.content.strip()
-            # Пытаемся извлечь число
-            import re
-            match = re.search(r'\d+', response_text)
-            if match:
-                score = float(match.group())
-                score = min(100, max(0, score))
-            else:
-                score = 0.0
-            
-            logger.info(f"✅ Scored content {content.id}: {score}")
-            return score
-        
         except Exception as e:
             logger.error(f"❌ Scoring error: {e}")
-            return 0.0
+            raise
+
+        response_text = (response.choices[0].message.content or "").strip()
+        # Пытаемся извлечь число
+        import re
+        match = re.search(r'\d+', response_text)
+        if not match:
+            raise ValueError(f"Unparseable score for content {content.id}: {response_text!r}")
+        score = min(100, max(0, float(match.group())))
+
+        logger.info(f"✅ Scored content {content.id}: {score}")
+        return score
 
     def generate_carousel_plan(self, content: ContentSource) -> dict:
         """Создать план карусели на основе контента"""
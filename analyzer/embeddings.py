@@ -0,0 +1,87 @@
+"""
+Провайдеры эмбеддингов для подписей контента.
+
+- openai: text-embedding-3-small через API (батчами);
+- local: детерминированный hashing-эмбеддинг на CPU (слова + символьные триграммы),
+  без сети и без весов модели — для офлайн-разработки и тестов.
+"""
+import os
+import re
+import zlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProvider:
+    name = "base"
+    dim = 0
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Вернуть матрицу float32 [len(texts), dim] с L2-нормированными строками"""
+        raise NotImplementedError
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = "openai"
+
+    def __init__(self, client=None, model: str = "text-embedding-3-small", dim: int = 1536,
+                 batch_size: int = 100):
+        if client is None:
+            # Локальному провайдеру openai не нужен, поэтому импорт здесь
+            from openai import OpenAI
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = client
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            # Пустые строки API не принимает
+            batch = [text or " " for text in texts[start:start + self.batch_size]]
+            response = self.client.embeddings.create(model=self.model, input=batch)
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda d: d.index))
+        return _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim))
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    name = "local"
+    _token_re = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = self._token_re.findall((text or "").lower())
+        yield from words
+        for word in words:
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # Знак из старшего бита уменьшает смещение от коллизий
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+def get_embedding_provider(name: str = None, client=None) -> EmbeddingProvider:
+    name = name or os.getenv("EMBEDDINGS_PROVIDER", "openai")
+    if name == "local":
+        return HashingEmbeddingProvider()
+    if name == "openai":
+        return OpenAIEmbeddingProvider(client=client)
+    raise ValueError(f"Unknown embeddings provider: {name}")
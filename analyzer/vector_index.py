@@ -0,0 +1,203 @@
+"""
+Компактный индекс векторов на диске.
+
+    <dir>/vectors.f32  — матрица float32 [count, dim], дописывается в конец
+    <dir>/ids.i64      — id ContentSource в том же порядке (порядок добавления, не обязательно по возрастанию)
+    <dir>/meta.json    — {provider, dim, count}; пишется последним и служит точкой фиксации
+    <dir>/.lock        — flock писателя: дописывать может только один процесс
+
+Поиск — косинусная близость по нормированным векторам. Если установлен hnswlib,
+строится ANN-индекс (HNSW), иначе используется точный перебор numpy по memmap.
+"""
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+import logging
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Ниже этого размера точный перебор быстрее построения HNSW
+ANN_MIN_ITEMS = 20000
+
+
+class VectorIndex:
+    def __init__(self, directory: str = None, dim: int = None, provider: str = None):
+        self.directory = directory or os.getenv("EMBEDDINGS_DIR", "storage/embeddings")
+        self.dim = dim
+        self.provider = provider
+        self.count = 0
+        self._vectors = None
+        self._ids = None
+        # Отсортированные id и их позиции в файле — для поиска по id
+        self._sorted_ids = None
+        self._order = None
+        self._ann = None
+        self._ann_thread = None
+        self._meta_mtime = None
+        self._lock = threading.RLock()
+        self.reload()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def reload(self, force: bool = False):
+        """Перечитать индекс, если писатель (задача эмбеддингов) зафиксировал новые векторы"""
+        with self._lock:
+            if not os.path.exists(self._meta_path):
+                return
+            mtime = os.path.getmtime(self._meta_path)
+            if not force and mtime == self._meta_mtime:
+                return
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if self.provider and meta["provider"] != self.provider:
+                raise ValueError(f"Index built with {meta['provider']}, expected {self.provider}")
+            previous = self.count
+            self.dim, self.provider, self.count = meta["dim"], meta["provider"], meta["count"]
+            self._meta_mtime = mtime
+            if self.count:
+                # Файлы могут быть длиннее count, если запись прервалась до meta.json
+                self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r",
+                                          shape=(self.count, self.dim))
+                self._ids = np.fromfile(self._path("ids.i64"), dtype=np.int64, count=self.count)
+                self._order = np.argsort(self._ids, kind="stable")
+                self._sorted_ids = self._ids[self._order]
+            if self._ann is not None and self.count > previous:
+                # Индекс только растет: дописываем новые векторы в HNSW без перестройки
+                self._ann.resize_index(self.count)
+                self._ann.add_items(np.asarray(self._vectors[previous:]), self._ids[previous:])
+
+    @contextmanager
+    def _write_lock(self):
+        """Эксклюзивная блокировка между процессами (prefork-воркеры, долгий бэкфилл)"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, ids: list[int], vectors: np.ndarray) -> int:
+        """
+        Дописать векторы (ids в любом порядке). Строки, которые уже есть в индексе
+        (например, их успел дописать другой процесс), отбрасываются.
+        Возвращает количество добавленных.
+        """
+        if not len(ids):
+            return 0
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, self._write_lock():
+            # Состояние под блокировкой читаем с диска, а не из памяти процесса
+            self.reload(force=True)
+            _, first = np.unique(ids, return_index=True)
+            fresh = np.zeros(len(ids), dtype=bool)
+            fresh[first] = True
+            fresh &= np.array([self.position_of(int(i)) is None for i in ids], dtype=bool)
+            if not fresh.any():
+                return 0
+            ids, vectors = ids[fresh], vectors[fresh]
+            self.dim = self.dim or vectors.shape[1]
+            # Обрезаем хвост от прерванной записи, затем дописываем
+            for name, itemsize, data in (("vectors.f32", 4 * self.dim, vectors), ("ids.i64", 8, ids)):
+                path = self._path(name)
+                with open(path, "ab") as f:
+                    f.truncate(self.count * itemsize)
+                    f.write(data.tobytes())
+            tmp_path = self._meta_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"provider": self.provider, "dim": self.dim, "count": self.count + len(ids)}, f)
+            os.replace(tmp_path, self._meta_path)
+            self.reload(force=True)
+            return len(ids)
+
+    def position_of(self, content_id: int) -> int | None:
+        if not self.count:
+            return None
+        pos = int(np.searchsorted(self._sorted_ids, content_id))
+        if pos < self.count and self._sorted_ids[pos] == content_id:
+            return int(self._order[pos])
+        return None
+
+    def vector_of(self, content_id: int) -> np.ndarray | None:
+        pos = self.position_of(content_id)
+        return None if pos is None else np.asarray(self._vectors[pos])
+
+    def _ann_index(self):
+        """
+        HNSW-индекс, если он уже построен. Построение над всем индексом занимает
+        минуты, поэтому идет в фоновом потоке; до его окончания поиск — точный перебор.
+        """
+        if hnswlib is None or self.count < ANN_MIN_ITEMS:
+            return None
+        if self._ann is None and self._ann_thread is None:
+            self._ann_thread = threading.Thread(target=self._build_ann, name="hnsw-build", daemon=True)
+            self._ann_thread.start()
+        return self._ann
+
+    def _build_ann(self):
+        try:
+            with self._lock:
+                count, dim, vectors, ids = self.count, self.dim, self._vectors, self._ids
+            ann = hnswlib.Index(space="ip", dim=dim)
+            ann.init_index(max_elements=count, ef_construction=200, M=16)
+            ann.add_items(np.asarray(vectors), ids)
+            ann.set_ef(64)
+            with self._lock:
+                # Пока строили, индекс мог вырасти — догоняем хвост
+                if self.count > count:
+                    ann.resize_index(self.count)
+                    ann.add_items(np.asarray(self._vectors[count:]), self._ids[count:])
+                self._ann = ann
+            logger.info(f"✅ Built HNSW index over {count} vectors")
+        except Exception as e:
+            logger.error(f"❌ HNSW build failed, using exact search: {e}")
+        finally:
+            self._ann_thread = None
+
+    def warm_up(self):
+        """Подхватить индекс с диска и запустить фоновое построение HNSW (при старте API)"""
+        self.reload()
+        with self._lock:
+            self._ann_index()
+
+    def search(self, vector: np.ndarray, k: int = 10, exclude_ids: set = None) -> list[tuple[int, float]]:
+        """Ближайшие соседи: [(content_id, cosine_similarity)] по убыванию близости"""
+        exclude_ids = exclude_ids or set()
+        with self._lock:
+            if not self.count:
+                return []
+            want = min(self.count, k + len(exclude_ids))
+            ann = self._ann_index()
+            if ann is not None:
+                labels, distances = ann.knn_query(vector, k=want)
+                pairs = [(int(label), 1.0 - float(dist)) for label, dist in zip(labels[0], distances[0])]
+            else:
+                scores = self._vectors @ np.asarray(vector, dtype=np.float32)
+                top = np.argpartition(-scores, want - 1)[:want]
+                top = top[np.argsort(-scores[top])]
+                pairs = [(int(self._ids[i]), float(scores[i])) for i in top]
+        return [(cid, score) for cid, score in pairs if cid not in exclude_ids][:k]
+
+    def novelty(self, content_id: int) -> float | None:
+        """1 - близость к ближайшему другому элементу; None, если элемент еще не проиндексирован"""
+        vector = self.vector_of(content_id)
+        if vector is None:
+            return None
+        neighbours = self.search(vector, k=1, exclude_ids={content_id})
+        if not neighbours:
+            return 1.0
+        return max(0.0, min(1.0, 1.0 - neighbours[0][1]))
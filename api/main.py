@@ -1,12 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from database.init_db import engine, Base, SessionLocal
 from database.models import PipelineRun
+from database.outbox import enqueue_task
+from storage.cache import get_response_cache, invalidate
+import asyncio
+import base64
+import hashlib
 import logging
+import time
+import orjson
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Инициализация логирования
 logging.basicConfig(level=logging.INFO)
@@ -16,9 +23,16 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="Content Factory API", version="1.0.0")
 
 class RunCreate(BaseModel):
-    type: str  # discovery, harvest, scoring
+    type: str  # discovery, harvest, hashtags, scoring
     config: Optional[Dict[str, Any]] = None
 
+class PreviewStructure(BaseModel):
+    slides: List[Dict[str, Any]]  # CarouselPlan.structure["slides"]
+
+class PreviewRequest(BaseModel):
+    structure: PreviewStructure
+    theme: str = "dark"
+
 # Настройка CORS
 origins = [
     "http://localhost:8080",
@@ -34,6 +48,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _row_to_dict(obj) -> dict:
+    """ORM-объект -> dict по колонкам таблицы (без отношений)"""
+    return {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Точное сравнение со списком If-None-Match; слабые W/"..." строгому ETag не равны"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def cached_json(request: Request, namespace: str, params: dict, loader) -> Response:
+    """
+    JSON-ответ из Redis-кэша со строгим ETag.
+    loader вызывается только при промахе; If-None-Match с тем же ETag дает 304 без тела.
+    """
+    cache = get_response_cache()
+    key = cache.key_for(namespace, params)
+    cached = cache.get(key) if key else None
+    if cached:
+        etag, body = cached
+    else:
+        body = orjson.dumps(loader())
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if key:
+            cache.set(key, etag, body)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Долгоживущий сервис превью: прогретые шрифты/шаблоны и кэш последних рендеров
+preview_service = None
+
+@app.on_event("startup")
+def start_preview_service():
+    global preview_service
+    from renderer.preview_service import PreviewService
+    preview_service = PreviewService()
+    preview_service.warm_up()
+
+@app.on_event("startup")
+def start_vector_index():
+    # HNSW строится в фоне сразу при старте, а не на первом запросе похожих
+    try:
+        get_vector_index().warm_up()
+    except Exception as e:
+        logger.warning(f"⚠️ Vector index warm-up failed: {e}")
+
+@app.on_event("shutdown")
+def stop_preview_service():
+    if preview_service is not None:
+        preview_service.shutdown()
+
+async def render_preview(structure: dict, theme: str) -> dict:
+    from renderer.preview_service import PreviewOverloaded
+    # Превью читает только слайды; мусорные элементы (не dict) отбрасываем
+    structure = {"slides": [slide for slide in structure.get("slides") or [] if isinstance(slide, dict)]}
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        slides, cached = await loop.run_in_executor(None, preview_service.render, structure, theme)
+    except PreviewOverloaded:
+        raise HTTPException(status_code=503, detail="Preview renderer is busy, retry later")
+    return {
+        "slides": [
+            {
+                "number": slide.get("number", index),
+                "image": "data:image/webp;base64," + base64.b64encode(image).decode("ascii"),
+            }
+            for index, (slide, image) in enumerate(zip(structure.get("slides", []), slides), start=1)
+        ],
+        "cached": cached,
+        "render_ms": round((time.perf_counter() - started) * 1000),
+    }
+
 @app.get("/api/health")
 async def health_check():
     """Проверка работоспособности сервиса"""
@@ -42,7 +131,6 @@ async def health_check():
 @app.post("/api/ideas/{id}/approve")
 async def approve_idea(id: int):
     """Одобрить идею и запустить асинхронную генерацию карусели"""
-    from tasks.generation import generate_carousel_pipeline
     from database.models import ContentSource
     
     db = SessionLocal()
@@ -50,23 +138,57 @@ async def approve_idea(id: int):
         idea = db.query(ContentSource).filter_by(id=id).first()
         if not idea:
             return {"status": "error", "message": "Idea not found"}
+        if idea.status in ("generating", "completed"):
+            # Повторное одобрение не должно сбрасывать идущую или готовую генерацию
+            return {"status": "success", "message": "Generation already started"}
             
         idea.status = "approved"
+        # Элемент мог быть в аренде у скоринга (pending/scoring): снимаем аренду,
+        # воркер скоринга увидит смену статуса и не перезапишет одобрение
+        idea.lease_owner = None
+        idea.lease_expires_at = None
+        # Задача уходит в брокер через outbox, в одной транзакции со статусом
+        enqueue_task(db, "tasks.generation.generate_carousel_pipeline", [idea.id])
         db.commit()
-        
-        # Запуск асинхронного пайплайна
-        generate_carousel_pipeline.delay(idea.id)
+        invalidate("content")
         
         return {"status": "success", "message": "Generation started"}
     finally:
         db.close()
 
+@app.post("/api/content/{id}/media")
+async def download_content_media(id: int):
+    """Запросить скачивание видео/обложки для одобренного контента"""
+    from database.models import ContentSource
+    from storage.media_downloader import MEDIA_STATUSES
+
+    db = SessionLocal()
+    try:
+        source = db.query(ContentSource).filter_by(id=id).first()
+        if not source:
+            raise HTTPException(status_code=404, detail="Content not found")
+        if source.status not in MEDIA_STATUSES:
+            raise HTTPException(status_code=409, detail="Media is downloaded only for approved content")
+
+        enqueue_task(db, "tasks.media.download_source_media", [[source.id]])
+        db.commit()
+        return {"status": "success", "message": "Media download started"}
+    finally:
+        db.close()
+
+# Тип запуска -> Celery-задача, все они принимают (run_id, config)
+RUN_TASKS = {
+    "discovery": "tasks.discovery.discovery_accounts",
+    "harvest": "tasks.harvest.harvest_instagram_content",
+    "hashtags": "tasks.hashtags.harvest_hashtags",
+    "scoring": "tasks.scoring.score_pending",
+}
+
 @app.post("/api/runs/start")
 async def start_run(run_data: RunCreate):
-    """Запустить новый пайплайн (создает запись и ставит задачу в Celery)"""
-    from tasks.discovery import discovery_accounts
-    from tasks.harvest import harvest_instagram_content
-    from tasks.scoring import score_pending
+    """Запустить новый пайплайн (создает запись и ставит задачу в outbox)"""
+    if run_data.type not in RUN_TASKS:
+        raise HTTPException(status_code=400, detail="Invalid run type")
     
     db = SessionLocal()
     try:
@@ -76,26 +198,54 @@ async def start_run(run_data: RunCreate):
             config_snapshot=run_data.config or {}
         )
         db.add(run)
-        db.commit()
-        db.refresh(run)
+        db.flush()  # нужен run.id для аргументов задачи
         
-        # Запуск задачи в Celery
-        if run_data.type == "discovery":
-            discovery_accounts.delay(run.id, run_data.config or {})
-        elif run_data.type == "harvest":
-            harvest_instagram_content.delay(run.id, run_data.config or {})
-        elif run_data.type == "scoring":
-            score_pending.delay(run.id)
-        else:
-            run.status = "failed"
-            run.error_log = f"Unknown run type: {run_data.type}"
-            db.commit()
-            raise HTTPException(status_code=400, detail="Invalid run type")
+        enqueue_task(db, RUN_TASKS[run_data.type], [run.id, run_data.config or {}], idempotency_key=f"run:{run.id}")
+        db.commit()
+        invalidate("runs")
             
         return {"status": "success", "run_id": run.id}
     finally:
         db.close()
 
+@app.get("/api/runs/stats")
+async def run_stats(bucket: str = "hour", hours: int = 24, type: Optional[str] = None):
+    """Агрегированная статистика запусков (из роллапов, без сканирования журнала)"""
+    from database.models import PipelineRunRollup
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="bucket must be 'hour' or 'day'")
+
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(hours=hours)
+        query = db.query(PipelineRunRollup).filter(
+            PipelineRunRollup.bucket == bucket, PipelineRunRollup.bucket_start >= since
+        )
+        if type:
+            query = query.filter(PipelineRunRollup.type == type)
+
+        series = []
+        totals = {}
+        for row in query.order_by(PipelineRunRollup.bucket_start, PipelineRunRollup.type):
+            finished = row.completed + row.failed
+            series.append({
+                "bucket_start": row.bucket_start,
+                "type": row.type,
+                "runs": row.runs,
+                "items": row.items,
+                "success_rate": row.completed / finished if finished else None,
+                "duration": {"avg": row.duration_avg, "p50": row.duration_p50,
+                             "p90": row.duration_p90, "p99": row.duration_p99},
+            })
+            total = totals.setdefault(row.type, {"runs": 0, "completed": 0, "failed": 0, "items": 0})
+            total["runs"] += row.runs
+            total["completed"] += row.completed
+            total["failed"] += row.failed
+            total["items"] += row.items
+        return {"bucket": bucket, "series": series, "totals": totals}
+    finally:
+        db.close()
+
 @app.get("/api/runs/{run_id}")
 async def get_run_status(run_id: int):
     """Получить статус выполнения пайплайна"""
@@ -108,41 +258,134 @@ async def get_run_status(run_id: int):
     finally:
         db.close()
 
+# Поля stats, которые нужны списку запусков (остальное — в /api/runs/{id})
+RUN_SUMMARY_STATS = ("found", "saved", "scored", "failed")
+
 @app.get("/api/runs")
-async def list_runs(limit: int = 10):
-    """Получить список последних запусков"""
-    db = SessionLocal()
-    try:
-        runs = db.query(PipelineRun).order_by(PipelineRun.id.desc()).limit(limit).all()
-        return runs
-    finally:
-        db.close()
+async def list_runs(request: Request, limit: int = 10):
+    """Получить список последних запусков (компактно, без конфигов и логов)"""
+    def load():
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(PipelineRun.id, PipelineRun.type, PipelineRun.status, PipelineRun.stats,
+                         PipelineRun.started_at, PipelineRun.finished_at,
+                         PipelineRun.error_log.isnot(None).label("has_error"))
+                .order_by(PipelineRun.id.desc())
+                .limit(limit)
+                .all()
+            )
+            return [
+                {
+                    **row._asdict(),
+                    "stats": {k: v for k, v in (row.stats or {}).items() if k in RUN_SUMMARY_STATS},
+                }
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+    return cached_json(request, "runs", {"limit": limit}, load)
+
+CONTENT_SORT_FIELDS = ("score", "likes", "views", "comments", "posted_at")
 
 @app.get("/api/content")
-async def list_content(status: Optional[str] = None, limit: int = 50):
+async def list_content(request: Request, status: Optional[str] = None, limit: int = 50, sort: str = "score",
+                       author: Optional[str] = None, media_type: Optional[str] = None):
     """Получить список контента (идей)"""
     from database.models import ContentSource
+    if sort not in CONTENT_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(CONTENT_SORT_FIELDS)}")
+
+    def load():
+        db = SessionLocal()
+        try:
+            query = db.query(ContentSource)
+            if status:
+                query = query.filter(ContentSource.status == status)
+            if author:
+                query = query.filter(ContentSource.author == author)
+            if media_type:
+                query = query.filter(ContentSource.media_type == media_type)
+            
+            order_column = getattr(ContentSource, sort)
+            items = query.order_by(order_column.desc().nulls_last()).limit(limit).all()
+            return [_row_to_dict(item) for item in items]
+        finally:
+            db.close()
+
+    params = {"status": status, "limit": limit, "sort": sort, "author": author, "media_type": media_type}
+    return cached_json(request, "content", params, load)
+
+vector_index = None
+
+def get_vector_index():
+    global vector_index
+    from analyzer.vector_index import VectorIndex
+    if vector_index is None:
+        vector_index = VectorIndex()
+    return vector_index
+
+@app.get("/api/content/{id}/similar")
+def similar_content(id: int, limit: int = 10):
+    """Похожие идеи по эмбеддингам подписей (sync: FastAPI выполнит в пуле потоков, не блокируя цикл)"""
+    from database.models import ContentSource
+
+    limit = max(1, min(limit, 100))
+    index = get_vector_index()
+    index.reload()
+    vector = index.vector_of(id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Content is not indexed yet")
+
+    neighbours = index.search(vector, k=limit, exclude_ids={id})
     db = SessionLocal()
     try:
-        query = db.query(ContentSource)
-        if status:
-            query = query.filter(ContentSource.status == status)
-        
-        items = query.order_by(ContentSource.score.desc().nulls_last()).limit(limit).all()
-        return items
+        rows = db.query(ContentSource).filter(ContentSource.id.in_([cid for cid, _ in neighbours])).all()
+        by_id = {row.id: row for row in rows}
+        return [
+            {"similarity": round(similarity, 4), **_row_to_dict(by_id[cid])}
+            for cid, similarity in neighbours if cid in by_id
+        ]
     finally:
         db.close()
 
 @app.get("/api/carousels")
-async def list_carousels(limit: int = 10):
+async def list_carousels(request: Request, limit: int = 10):
     """Получить список готовых каруселей"""
     from database.models import Carousel, CarouselPlan
+
+    def load():
+        db = SessionLocal()
+        try:
+            carousels = db.query(Carousel).join(CarouselPlan).order_by(Carousel.id.desc()).limit(limit).all()
+            return [_row_to_dict(carousel) for carousel in carousels]
+        finally:
+            db.close()
+
+    return cached_json(request, "carousels", {"limit": limit}, load)
+
+@app.post("/api/preview")
+async def preview_plan(preview: PreviewRequest):
+    """Быстрое превью плана карусели (WebP низкого разрешения) без запуска генерации"""
+    from renderer.templates import available_templates
+    if preview.theme not in available_templates():
+        raise HTTPException(status_code=400, detail=f"Unknown theme: {preview.theme}")
+    return await render_preview({"slides": preview.structure.slides}, preview.theme)
+
+@app.get("/api/plans/{id}/preview")
+async def preview_saved_plan(id: int):
+    """Превью сохраненного CarouselPlan"""
+    from database.models import CarouselPlan
     db = SessionLocal()
     try:
-        carousels = db.query(Carousel).join(CarouselPlan).order_by(Carousel.id.desc()).limit(limit).all()
-        return carousels
+        plan = db.query(CarouselPlan).filter(CarouselPlan.id == id).first()
+        if not plan:
+            raise HTTPException(status_code=404, detail="Plan not found")
+        structure, theme = plan.structure, plan.theme or "dark"
     finally:
         db.close()
+    return await render_preview(structure, theme)
 
 @app.get("/api/carousels/{id}/download")
 async def get_carousel_download_url(id: int):
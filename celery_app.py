@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,7 +11,7 @@ celery_app = Celery(
     "content_factory",
     broker=redis_url,
     backend=redis_url,
-    include=["tasks.ping", "tasks.discovery", "tasks.harvest", "tasks.scoring", "tasks.generation"]
+    include=["tasks.ping", "tasks.discovery", "tasks.harvest", "tasks.hashtags", "tasks.scoring", "tasks.generation", "tasks.media", "tasks.outbox", "tasks.run_stats", "tasks.embeddings"]
 )
 
 celery_app.conf.update(
@@ -19,14 +20,57 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    # С acks_late воркер не должен набирать задачи впрок: при падении
+    # их бы пришлось ждать до visibility timeout
+    worker_prefetch_multiplier=1,
+    # Релей outbox живет в своей очереди с отдельным воркером: пока общий пул
+    # занят долгими задачами (ожидание Apify, скоринг), отправка не встает
+    task_routes={
+        "tasks.outbox.*": {"queue": "outbox"},
+    },
     beat_schedule={
         "ping-every-1-minute": {
             "task": "tasks.ping.ping",
             "schedule": 60.0,
         },
+        "relay-outbox": {
+            "task": "tasks.outbox.relay_outbox",
+            "schedule": float(os.getenv("OUTBOX_RELAY_INTERVAL", "2")),
+            # Если воркеры заняты, устаревшие тики релея не копятся в очереди
+            "options": {"expires": 10},
+        },
+        "purge-outbox-daily": {
+            "task": "tasks.outbox.purge_outbox",
+            "schedule": 86400.0,
+        },
+        "refresh-run-rollups": {
+            "task": "tasks.run_stats.refresh_run_rollups",
+            "schedule": 300.0,
+        },
+        "compact-runs-daily": {
+            "task": "tasks.run_stats.compact_runs",
+            "schedule": 86400.0,
+        },
+        "embed-new-content": {
+            "task": "tasks.embeddings.embed_new_content",
+            "schedule": 600.0,
+        },
     },
 )
 
+
+@worker_process_init.connect
+def _init_worker_resources(**kwargs):
+    from tasks.resources import init_worker_resources
+    init_worker_resources(**kwargs)
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker_resources(**kwargs):
+    from tasks.resources import shutdown_worker_resources
+    shutdown_worker_resources(**kwargs)
+
+
 if __name__ == "__main__":
     celery_app.start()
 
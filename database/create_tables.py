@@ -1,5 +1,5 @@
 from database.init_db import engine, Base
-from database.models import ContentSource, Account, CarouselPlan, Carousel
+from database.models import ContentSource, ContentPayload, Account, CarouselPlan, Carousel, PipelineRun, HashtagCursor, DispatchOutbox, PipelineRunRollup
 import logging
 
 # Настройка логирования
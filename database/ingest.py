@@ -0,0 +1,76 @@
+import os
+import logging
+from datetime import datetime
+from database.models import ContentSource, ContentPayload
+
+logger = logging.getLogger(__name__)
+
+# Хранить сырой ответ парсера сжатым в content_payloads вместо JSON в content_sources
+COMPRESS_RAW_PAYLOADS = os.getenv("COMPRESS_RAW_PAYLOADS", "false").lower() == "true"
+
+# Типы медиа Apify -> наши
+APIFY_MEDIA_TYPES = {"Video": "reel", "Sidecar": "carousel", "Image": "photo"}
+
+
+def _first(item: dict, *keys):
+    for key in keys:
+        value = item.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _count(value) -> int | None:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    # Apify отдает -1, если автор скрыл лайки
+    return value if value >= 0 else None
+
+
+def _timestamp(value) -> datetime | None:
+    if not value:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    # Колонки хранят naive UTC, как и остальные DateTime в моделях
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+
+def engagement_fields(item: dict) -> dict:
+    """
+    Извлечь типизированные поля вовлеченности из сырого ответа.
+    Понимает и формат InstagramParser, и формат акторов Apify.
+    """
+    media_type = _first(item, "type", "productType")
+    return {
+        "likes": _count(_first(item, "likes", "likesCount")),
+        "views": _count(_first(item, "views", "videoViewCount", "videoPlayCount")),
+        "comments": _count(_first(item, "comments", "commentsCount")),
+        "author": _first(item, "author", "ownerUsername"),
+        "media_type": APIFY_MEDIA_TYPES.get(media_type, media_type),
+        "posted_at": _timestamp(_first(item, "posted_at", "timestamp", "taken_at")),
+    }
+
+
+def new_content_source(item: dict, url: str, platform: str, caption: str, status: str = "pending") -> ContentSource:
+    """Создать ContentSource с заполненными колонками вовлеченности"""
+    source = ContentSource(
+        url=url,
+        platform=platform,
+        caption=caption,
+        status=status,
+        **engagement_fields(item),
+    )
+    if COMPRESS_RAW_PAYLOADS:
+        source.payload = ContentPayload.from_item(item)
+    else:
+        source.metadata_info = item  # JSON
+    return source
@@ -0,0 +1,114 @@
+"""
+Миграции схемы для уже существующей БД.
+
+`create_all` создает только отсутствующие таблицы, но не добавляет колонки
+в существующие, поэтому новые колонки и индексы описаны здесь идемпотентным DDL.
+
+    python -m database.migrate                     # DDL
+    python -m database.migrate --backfill          # + заполнить колонки вовлеченности
+    python -m database.migrate --backfill --compress  # + перенести сырой JSON в content_payloads
+"""
+import argparse
+import logging
+from sqlalchemy import text, null
+from database.init_db import engine, Base, SessionLocal
+from database.models import ContentSource, ContentPayload
+from database.ingest import engagement_fields
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATCHES = [
+    # Колонки вовлеченности в content_sources
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS likes INTEGER",
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS views INTEGER",
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS comments INTEGER",
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS author VARCHAR(255)",
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS media_type VARCHAR(50)",
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS posted_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_content_sources_likes ON content_sources (likes)",
+    "CREATE INDEX IF NOT EXISTS ix_content_sources_views ON content_sources (views)",
+    "CREATE INDEX IF NOT EXISTS ix_content_sources_author ON content_sources (author)",
+    "CREATE INDEX IF NOT EXISTS ix_content_sources_media_type ON content_sources (media_type)",
+    "CREATE INDEX IF NOT EXISTS ix_content_sources_posted_at ON content_sources (posted_at)",
+    "CREATE INDEX IF NOT EXISTS idx_status_likes ON content_sources (status, likes)",
+    "CREATE INDEX IF NOT EXISTS idx_status_views ON content_sources (status, views)",
+    # Чекпоинты задач пайплайна
+    "ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS checkpoint JSON",
+    # Аренда элементов при параллельном скоринге
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(255)",
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS idx_status_lease ON content_sources (status, lease_expires_at)",
+    # Инкрементальный пересчет роллапов запусков
+    "CREATE INDEX IF NOT EXISTS ix_pipeline_runs_finished_at ON pipeline_runs (finished_at)",
+    "CREATE INDEX IF NOT EXISTS ix_pipeline_runs_updated_at ON pipeline_runs (updated_at)",
+    # Новизна контента по эмбеддингам
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS novelty FLOAT",
+    # Признак "уже в векторном индексе" вместо прохода по id > max_id
+    "ALTER TABLE content_sources ADD COLUMN IF NOT EXISTS embedded_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS idx_pending_embedding ON content_sources (id) WHERE embedded_at IS NULL",
+]
+
+
+def run_migrations():
+    logger.info("Applying schema patches...")
+    # Новые таблицы целиком создает create_all
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for statement in SCHEMA_PATCHES:
+            conn.execute(text(statement))
+    logger.info(f"✅ Applied {len(SCHEMA_PATCHES)} schema patches")
+
+
+def backfill_engagement(batch_size: int = 1000, compress: bool = False, start_id: int = 0):
+    """
+    Заполнить колонки вовлеченности для существующих строк пачками по id (keyset).
+    Каждая пачка коммитится отдельно, поэтому прерванный backfill можно
+    продолжить с --start-id последнего залогированного id.
+    """
+    db = SessionLocal()
+    last_id = start_id
+    total = 0
+    try:
+        while True:
+            rows = (
+                db.query(ContentSource)
+                .filter(ContentSource.id > last_id, ContentSource.metadata_info.isnot(None))
+                .order_by(ContentSource.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            for row in rows:
+                item = row.metadata_info
+                for field, value in engagement_fields(item).items():
+                    setattr(row, field, value)
+                if compress:
+                    row.payload = ContentPayload.from_item(item)
+                    # SQL NULL, а не JSON 'null': строка больше не попадет в выборку backfill
+                    row.metadata_info = null()
+
+            db.commit()
+            last_id = rows[-1].id
+            total += len(rows)
+            logger.info(f"💾 Backfilled {total} rows (last id {last_id})")
+            # Не держим всю таблицу в identity map
+            db.expunge_all()
+    finally:
+        db.close()
+    logger.info(f"✅ Backfill finished: {total} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema patches and backfills")
+    parser.add_argument("--backfill", action="store_true", help="fill engagement columns from metadata_info")
+    parser.add_argument("--compress", action="store_true", help="move raw metadata_info into content_payloads")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--start-id", type=int, default=0)
+    args = parser.parse_args()
+
+    run_migrations()
+    if args.backfill:
+        backfill_engagement(batch_size=args.batch_size, compress=args.compress, start_id=args.start_id)
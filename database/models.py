@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, JSON, Boolean, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, JSON, Boolean, ForeignKey, Index, LargeBinary, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database.init_db import Base
+import json
+import zlib
 
 class ContentSource(Base):
     """Спарсенный контент (Instagram, YouTube, TikTok)"""
@@ -12,11 +14,26 @@ class ContentSource(Base):
     platform = Column(String(50), nullable=False, index=True)  # instagram, youtube, tiktok
     caption = Column(Text, nullable=True)
     metadata_info = Column(JSON, nullable=True)  # {views, likes, comments, author, ...} renamed to avoid conflict
-    status = Column(String(50), default="pending", index=True)  # pending, scored, approved, archived
+    status = Column(String(50), default="pending", index=True)  # pending, scoring, scored, approved, generating, completed, archived
     score = Column(Float, nullable=True, index=True)  # 0-100
+    novelty = Column(Float, nullable=True)  # 0-1, 1 - близость к ближайшему похожему контенту
+    embedded_at = Column(DateTime, nullable=True)  # подпись добавлена в векторный индекс
+    
+    # Аренда элемента воркером скоринга (SELECT ... FOR UPDATE SKIP LOCKED)
+    lease_owner = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    
+    # Типизированные поля вовлеченности (заполняются при сохранении из metadata_info)
+    likes = Column(Integer, nullable=True, index=True)
+    views = Column(Integer, nullable=True, index=True)
+    comments = Column(Integer, nullable=True)
+    author = Column(String(255), nullable=True, index=True)
+    media_type = Column(String(50), nullable=True, index=True)  # reel, carousel, photo
+    posted_at = Column(DateTime, nullable=True, index=True)
     
     # Relations
     carousel_plans = relationship("CarouselPlan", back_populates="source")
+    payload = relationship("ContentPayload", uselist=False, cascade="all, delete-orphan")
     
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -24,8 +41,38 @@ class ContentSource(Base):
     __table_args__ = (
         Index('idx_platform_status_score', 'platform', 'status', 'score'),
         Index('idx_status_score', 'status', 'score'),
+        Index('idx_status_likes', 'status', 'likes'),
+        Index('idx_status_views', 'status', 'views'),
+        Index('idx_status_lease', 'status', 'lease_expires_at'),
+        # Очередь эмбеддингов: только строки, которых еще нет в индексе
+        Index('idx_pending_embedding', 'id', postgresql_where=text('embedded_at IS NULL')),
     )
 
+    @property
+    def raw_item(self) -> dict:
+        """Сырой ответ парсера: из metadata_info или из сжатого ContentPayload"""
+        if self.metadata_info is not None:
+            return self.metadata_info
+        if self.payload is not None:
+            return self.payload.data
+        return {}
+
+class ContentPayload(Base):
+    """Сырой ответ парсера в сжатом виде (вынесен из горячей таблицы content_sources)"""
+    __tablename__ = "content_payloads"
+
+    source_id = Column(Integer, ForeignKey("content_sources.id", ondelete="CASCADE"), primary_key=True)
+    compressed = Column(LargeBinary, nullable=False)  # zlib(JSON)
+
+    @classmethod
+    def from_item(cls, item: dict) -> "ContentPayload":
+        raw = json.dumps(item, ensure_ascii=False, default=str).encode("utf-8")
+        return cls(compressed=zlib.compress(raw, 6))
+
+    @property
+    def data(self) -> dict:
+        return json.loads(zlib.decompress(self.compressed))
+
 class Account(Base):
     """Конкурентские аккаунты для парсинга"""
     __tablename__ = "accounts"
@@ -82,14 +129,70 @@ class PipelineRun(Base):
     __tablename__ = "pipeline_runs"
 
     id = Column(Integer, primary_key=True, index=True)
-    type = Column(String(50), nullable=False, index=True)  # discovery, harvest, scoring, complete
-    status = Column(String(50), default="pending", index=True)  # pending, running, completed, failed
+    type = Column(String(50), nullable=False, index=True)  # discovery, harvest, hashtags, scoring, complete
+    status = Column(String(50), default="pending", index=True)  # pending, running, retrying, completed, failed
     config_snapshot = Column(JSON, nullable=True)  # {strategy, limit, tags, ...}
     stats = Column(JSON, nullable=True)  # {found, saved, errors, ...}
+    checkpoint = Column(JSON, nullable=True)  # прогресс для продолжения после ретрая {apify_run_id, processed, ...}
     error_log = Column(Text, nullable=True)
     
     started_at = Column(DateTime, default=datetime.utcnow)
-    finished_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+class HashtagCursor(Base):
+    """Курсор постраничного парсинга хэштега (для продолжения после сбоя)"""
+    __tablename__ = "hashtag_cursors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    hashtag = Column(String(255), unique=True, nullable=False, index=True)
+    next_max_id = Column(String(500), nullable=True)  # курсор прерванного прохода; None — начинать с головы ленты
+    pages_fetched = Column(Integer, default=0)
+    items_saved = Column(Integer, default=0)
+    is_exhausted = Column(Boolean, default=False)  # последний проход дошел до конца ленты
+
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class DispatchOutbox(Base):
+    """Outbox задач Celery: пишется в одной транзакции с бизнес-данными, в брокер отправляется релеем"""
+    __tablename__ = "dispatch_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_name = Column(String(255), nullable=False)  # tasks.discovery.discovery_accounts, ...
+    args = Column(JSON, nullable=False, default=list)
+    idempotency_key = Column(String(255), unique=True, nullable=False)  # используется как task_id в Celery
+    status = Column(String(50), default="pending", index=True)  # pending, sent
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    dispatched_at = Column(DateTime, nullable=True, index=True)
+
+    __table_args__ = (
+        Index('idx_outbox_status_id', 'status', 'id'),
+    )
+
+class PipelineRunRollup(Base):
+    """Предагрегированная статистика запусков по типу и временному интервалу"""
+    __tablename__ = "pipeline_run_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket = Column(String(10), nullable=False)  # hour, day
+    bucket_start = Column(DateTime, nullable=False)
+    type = Column(String(50), nullable=False)
+    runs = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    items = Column(Integer, default=0)  # сумма stats.saved / stats.scored
+    duration_avg = Column(Float, nullable=True)  # секунды
+    duration_p50 = Column(Float, nullable=True)
+    duration_p90 = Column(Float, nullable=True)
+    duration_p99 = Column(Float, nullable=True)
+    refreshed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index('uq_rollup_bucket_type', 'bucket', 'bucket_start', 'type', unique=True),
+    )
@@ -0,0 +1,20 @@
+import uuid
+from sqlalchemy.orm import Session
+from database.models import DispatchOutbox
+
+
+def enqueue_task(db: Session, task_name: str, args: list, idempotency_key: str = None) -> DispatchOutbox:
+    """
+    Поставить задачу в outbox. Запись коммитится вызывающим кодом вместе
+    с бизнес-данными, в брокер ее отправит tasks.outbox.relay_outbox.
+    Ключ становится task_id в Celery, поэтому повторная доставка распознается задачей.
+    """
+    entry = DispatchOutbox(
+        task_name=task_name,
+        args=args,
+        idempotency_key=idempotency_key or f"{task_name}:{uuid.uuid4().hex}",
+        status="pending",
+        attempts=0,
+    )
+    db.add(entry)
+    return entry
@@ -53,10 +53,25 @@ class ApifyWrapper:
             logger.error(f"❌ Apify get status error: {e}")
             return "FAILED"
 
-    def get_dataset_items(self, dataset_id: str):
+    def wait_for_run(self, run_id: str, wait_secs: int = 300):
+        """
+        Дождаться завершения уже запущенного актора. Возвращает объект run
+        (status, defaultDatasetId) или None, если запрос не удался.
+        """
         try:
-            return self.client.dataset(dataset_id).list_items().items
+            return self.client.run(run_id).wait_for_finish(wait_secs=wait_secs)
+        except Exception as e:
+            logger.error(f"❌ Apify wait for run error: {e}")
+            return None
+
+    def get_dataset_items(self, dataset_id: str, offset: int = 0, limit: int = None):
+        """
+        Страница элементов датасета. Пустой список — конец датасета,
+        None — ошибка запроса (не путать с концом при постраничном чтении).
+        """
+        try:
+            return self.client.dataset(dataset_id).list_items(offset=offset, limit=limit).items
         except Exception as e:
             logger.error(f"❌ Apify get dataset error: {e}")
-            return []
+            return None
 
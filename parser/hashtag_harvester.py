@@ -0,0 +1,128 @@
+import queue
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+from parser.instagram_parser import save_hashtag_page, get_or_create_cursor, finish_hashtag_pass
+from parser.session_pool import SessionPool, RETRYABLE_ERRORS, AcquireCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class MultiHashtagHarvester:
+    """
+    Параллельный сбор нескольких хэштегов через пул сессий.
+
+    Каждый хэштег обходится своим потоком последовательно (страницы по курсору),
+    но каждая страница запрашивается любой свободной сессией пула. Запись в БД
+    выполняет только вызывающий поток: страницы приходят через очередь,
+    дедуплицируются по pk медиа между всеми хэштегами и сохраняются вместе с курсором.
+    """
+
+    def __init__(self, pool: SessionPool, page_size: int = 50, max_page_retries: int = 3,
+                 acquire_timeout: float = 600.0):
+        self.pool = pool
+        self.page_size = page_size
+        self.max_page_retries = max_page_retries
+        self.acquire_timeout = acquire_timeout
+
+    def _fetch_page(self, hashtag: str, max_id: str | None, stop: threading.Event):
+        last_error = None
+        for _ in range(self.max_page_retries):
+            try:
+                # stop прерывает ожидание сессии, иначе выход из пула потоков
+                # после ошибки записи ждал бы до acquire_timeout на каждый поток
+                with self.pool.session(timeout=self.acquire_timeout, cancel=stop) as session:
+                    return session.parser.fetch_hashtag_page(hashtag, max_id=max_id, page_size=self.page_size)
+            except RETRYABLE_ERRORS as e:
+                # Сессия ушла в cool-down или перелогинилась — повторяем страницу
+                last_error = e
+        raise last_error
+
+    @staticmethod
+    def _put(pages: queue.Queue, stop: threading.Event, message) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(message, timeout=1.0)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _crawl(self, hashtag: str, max_id: str | None, max_pages: int, pages: queue.Queue, stop: threading.Event):
+        try:
+            for _ in range(max_pages):
+                if stop.is_set():
+                    return
+                items, max_id = self._fetch_page(hashtag, max_id, stop)
+                if not self._put(pages, stop, ("page", hashtag, items, max_id)):
+                    return
+                if not max_id:
+                    break
+            self._put(pages, stop, ("done", hashtag, None, None))
+        except AcquireCancelled:
+            return
+        except Exception as e:
+            self._put(pages, stop, ("done", hashtag, e, None))
+
+    def harvest(self, db: Session, hashtags: list[str], amount_per_hashtag: int = 500) -> dict:
+        """Собрать хэштеги параллельно. Возвращает статистику по каждому хэштегу"""
+        stats = {"fetched": 0, "duplicates": 0, "saved": 0, "errors": {}, "hashtags": {}}
+
+        cursors = {}
+        for hashtag in dict.fromkeys(h.strip().lstrip("#") for h in hashtags if h.strip()):
+            cursors[hashtag] = get_or_create_cursor(db, hashtag)
+            stats["hashtags"][hashtag] = {"pages": 0, "saved": 0}
+        if not cursors:
+            return stats
+
+        max_pages = max(1, -(-amount_per_hashtag // self.page_size))
+        # Ограниченная очередь: потоки не убегают вперед записи в БД
+        pages = queue.Queue(maxsize=len(self.pool) * 4)
+        seen_pks = set()
+        stop = threading.Event()
+
+        workers = min(len(cursors), len(self.pool))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashtag") as executor:
+            for hashtag, cursor in cursors.items():
+                executor.submit(self._crawl, hashtag, cursor.next_max_id, max_pages, pages, stop)
+
+            try:
+                self._drain(db, pages, cursors, seen_pks, stats)
+            finally:
+                # При ошибке записи останавливаем потоки, иначе они повиснут на полной очереди
+                stop.set()
+
+        logger.info(f"✅ Harvested {len(cursors)} hashtags: {stats['saved']} new of {stats['fetched']} fetched")
+        return stats
+
+    def _drain(self, db: Session, pages: queue.Queue, cursors: dict, seen_pks: set, stats: dict):
+        """Принять страницы от потоков, дедуплицировать по pk и сохранить вместе с курсором"""
+        remaining = len(cursors)
+        while remaining:
+            kind, hashtag, payload, next_max_id = pages.get()
+            if kind == "done":
+                remaining -= 1
+                if payload is not None:
+                    # Курсор остается на последней сохраненной странице — следующий запуск продолжит
+                    logger.error(f"❌ #{hashtag} stopped: {payload}")
+                    stats["errors"][hashtag] = str(payload)
+                else:
+                    finish_hashtag_pass(db, cursors[hashtag])
+                continue
+
+            stats["fetched"] += len(payload)
+            unique = []
+            for item in payload:
+                key = item.get("pk") or item["url"]
+                if key in seen_pks:
+                    stats["duplicates"] += 1
+                    continue
+                seen_pks.add(key)
+                unique.append(item)
+
+            saved = save_hashtag_page(db, cursors[hashtag], unique, next_max_id)
+            stats["saved"] += saved
+            stats["hashtags"][hashtag]["pages"] += 1
+            stats["hashtags"][hashtag]["saved"] += saved
+
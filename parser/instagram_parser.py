@@ -1,28 +1,134 @@
 from instagrapi import Client
+from instagrapi.exceptions import LoginRequired
 import logging
 from datetime import datetime
 import os
 from sqlalchemy.orm import Session
-from database.models import ContentSource
+from database.models import ContentSource, HashtagCursor
+from database.ingest import new_content_source
+from storage.cache import invalidate
 
 logger = logging.getLogger(__name__)
 
+
+def add_new_items(db: Session, parsed_data: list[dict]) -> int:
+    """Добавить в сессию только отсутствующие в БД записи (одним запросом на страницу)"""
+    urls = {item["url"] for item in parsed_data}
+    if not urls:
+        return 0
+    existing = {url for (url,) in db.query(ContentSource.url).filter(ContentSource.url.in_(urls))}
+
+    count = 0
+    for item in parsed_data:
+        if item["url"] in existing:
+            continue
+        existing.add(item["url"])
+        
+        db.add(new_content_source(item, url=item["url"], platform=item["platform"], caption=item["caption"]))
+        count += 1
+    return count
+
+
+def save_hashtag_page(db: Session, cursor: HashtagCursor, items: list[dict], next_max_id: str | None) -> int:
+    """Сохранить страницу и продвинуть курсор хэштега одной транзакцией"""
+    count = add_new_items(db, items)
+    cursor.next_max_id = next_max_id
+    cursor.pages_fetched = (cursor.pages_fetched or 0) + 1
+    cursor.items_saved = (cursor.items_saved or 0) + count
+    cursor.is_exhausted = next_max_id is None
+    db.commit()
+    if count:
+        invalidate("content")
+    return count
+
+
+def finish_hashtag_pass(db: Session, cursor: HashtagCursor):
+    """
+    Проход по хэштегу завершился штатно: сбрасываем курсор, чтобы следующий
+    запуск начал с головы ленты "recent". Курсор сохраняется только после сбоя.
+    """
+    cursor.next_max_id = None
+    db.commit()
+
+
+def get_or_create_cursor(db: Session, hashtag: str) -> HashtagCursor:
+    cursor = db.query(HashtagCursor).filter_by(hashtag=hashtag).first()
+    if not cursor:
+        cursor = HashtagCursor(hashtag=hashtag, pages_fetched=0, items_saved=0, is_exhausted=False)
+        db.add(cursor)
+        db.commit()
+    return cursor
+
 class InstagramParser:
-    def __init__(self, username: str = None, password: str = None):
+    def __init__(self, username: str = None, password: str = None, session_path: str = None):
         self.client = Client()
         self.username = username or os.getenv("INSTAGRAM_USERNAME")
         self.password = password or os.getenv("INSTAGRAM_PASSWORD")
+        # Файл с настройками сессии instagrapi (cookies, uuids устройства)
+        self.session_path = session_path or os.getenv("INSTAGRAM_SESSION_PATH")
         
         if self.username and self.password:
             try:
-                self.client.login(self.username, self.password)
-                logger.info("✅ Instagram login successful")
+                self._login()
             except Exception as e:
                 logger.error(f"❌ Instagram login failed: {e}")
                 # Продолжаем без логина для публичных данных, если возможно
         else:
             logger.warning("⚠️ No Instagram credentials provided, functionality may be limited")
 
+    def _login(self):
+        """
+        Вход с переиспользованием сохраненной сессии.
+        Повторные полные логины быстро приводят к rate limit со стороны Instagram,
+        поэтому сначала пробуем восстановить сессию из файла.
+        """
+        if self.session_path and os.path.exists(self.session_path):
+            settings = self.client.load_settings(self.session_path)
+            self.client.set_settings(settings)
+            self.client.login(self.username, self.password)
+            try:
+                self.client.get_timeline_feed()
+                logger.info("✅ Instagram session restored")
+                return
+            except LoginRequired:
+                logger.warning("⚠️ Saved Instagram session expired, logging in again")
+                # Сохраняем uuids, чтобы Instagram видел то же "устройство"
+                self.client.set_settings({})
+                self.client.set_uuids(settings.get("uuids", {}))
+
+        self.client.login(self.username, self.password)
+        logger.info("✅ Instagram login successful")
+        self.dump_session()
+
+    def dump_session(self):
+        """Сохранить текущие настройки сессии на диск"""
+        if not self.session_path:
+            return
+        os.makedirs(os.path.dirname(self.session_path) or ".", exist_ok=True)
+        self.client.dump_settings(self.session_path)
+
+    def _media_to_dict(self, media) -> dict | None:
+        """Преобразовать Media из instagrapi в словарь для ContentSource"""
+        # Фильтруем только видео (Reels) или карусели, если нужно
+        # media_type: 1=Photo, 2=Video, 8=Album
+        if media.media_type not in [2, 8]:
+            return None
+        return {
+            "pk": str(media.pk),
+            "url": f"https://instagram.com/p/{media.pk}/",
+            "platform": "instagram",
+            "caption": media.caption_text or "",
+            "likes": media.like_count,
+            "comments": media.comment_count,
+            "views": getattr(media, 'play_count', 0), # play_count может не быть
+            "author": media.user.username,
+            "author_followers": 0, # Нужно отдельным запросом, если критично
+            "type": "reel" if media.media_type == 2 else "carousel",
+            "posted_at": media.taken_at.isoformat() if media.taken_at else None,
+            "video_url": str(media.video_url) if media.video_url else None,
+            "thumbnail_url": str(media.thumbnail_url) if media.thumbnail_url else None,
+        }
+
     def parse_hashtag(self, hashtag: str, amount: int = 20) -> list[dict]:
         """Парсить Reels по хэштегу"""
         logger.info(f"Searching for #{hashtag}...")
@@ -31,25 +137,7 @@ class InstagramParser:
             # instagrapi требует логин для hashtag_medias_recent обычно
             medias = self.client.hashtag_medias_recent(hashtag, amount=amount)
             
-            results = []
-            for media in medias:
-                # Фильтруем только видео (Reels) или карусели, если нужно
-                # media_type: 1=Photo, 2=Video, 8=Album
-                if media.media_type in [2, 8]: 
-                    data = {
-                        "url": f"https://instagram.com/p/{media.pk}/",
-                        "platform": "instagram",
-                        "caption": media.caption_text or "",
-                        "likes": media.like_count,
-                        "comments": media.comment_count,
-                        "views": getattr(media, 'play_count', 0), # play_count может не быть
-                        "author": media.user.username,
-                        "author_followers": 0, # Нужно отдельным запросом, если критично
-                        "type": "reel" if media.media_type == 2 else "carousel",
-                        "video_url": str(media.video_url) if media.video_url else None,
-                        "thumbnail_url": str(media.thumbnail_url) if media.thumbnail_url else None,
-                    }
-                    results.append(data)
+            results = [data for data in map(self._media_to_dict, medias) if data]
             
             logger.info(f"✅ Parsed {len(results)} posts from #{hashtag}")
             return results
@@ -58,30 +146,69 @@ class InstagramParser:
             logger.error(f"❌ Parsing error: {e}")
             return []
 
+    def fetch_hashtag_page(self, hashtag: str, max_id: str = None, page_size: int = 50) -> tuple[list[dict], str | None]:
+        """
+        Получить одну страницу свежих медиа по хэштегу.
+        Возвращает (items, next_max_id); next_max_id=None — лента закончилась.
+        Исключения instagrapi (rate limit и т.п.) пробрасываются вызывающему.
+        """
+        medias, next_max_id = self.client.hashtag_medias_v1_chunk(
+            hashtag, max_amount=page_size, tab_key="recent", max_id=max_id
+        )
+        items = [data for data in map(self._media_to_dict, medias) if data]
+        return items, next_max_id or None
+
+    def iter_hashtag_pages(self, hashtag: str, max_id: str = None, page_size: int = 50, max_pages: int = None):
+        """
+        Генератор страниц по хэштегу: yield (items, next_max_id).
+        В памяти одновременно держится только одна страница.
+        """
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            items, max_id = self.fetch_hashtag_page(hashtag, max_id=max_id, page_size=page_size)
+            pages += 1
+            yield items, max_id
+            if not max_id:
+                break
+
+    def harvest_hashtag(self, db: Session, hashtag: str, amount: int = 1000, page_size: int = 50) -> int:
+        """
+        Постраничный парсинг хэштега с сохранением каждой страницы сразу в БД.
+        Курсор хранится в HashtagCursor и коммитится вместе со страницей,
+        поэтому после сбоя или rate limit следующий вызов продолжит с того же места.
+        После штатного завершения курсор сбрасывается на голову ленты.
+        Возвращает количество новых записей.
+        """
+        cursor = get_or_create_cursor(db, hashtag)
+        if cursor.next_max_id:
+            logger.info(f"↪️ #{hashtag}: resuming interrupted pass at page {cursor.pages_fetched}")
+
+        max_pages = max(1, -(-amount // page_size))
+        saved = 0
+        try:
+            for items, next_max_id in self.iter_hashtag_pages(
+                hashtag, max_id=cursor.next_max_id, page_size=page_size, max_pages=max_pages
+            ):
+                saved += save_hashtag_page(db, cursor, items, next_max_id)
+            finish_hashtag_pass(db, cursor)
+        except Exception as e:
+            # Уже сохраненные страницы и курсор закоммичены — продолжим в следующий раз
+            db.rollback()
+            logger.error(f"❌ Parsing #{hashtag} interrupted at page {cursor.pages_fetched}: {e}")
+
+        logger.info(f"✅ #{hashtag}: saved {saved} new items (pages total: {cursor.pages_fetched})")
+        return saved
+
     def save_to_db(self, db: Session, parsed_data: list[dict]):
         """Сохраняет контент в БД"""
-        count = 0
-        for item in parsed_data:
-            existing = db.query(ContentSource).filter_by(url=item["url"]).first()
-            if existing:
-                continue
-            
-            source = ContentSource(
-                url=item["url"],
-                platform=item["platform"],
-                caption=item["caption"],
-                metadata_info=item,  # JSON
-                status="pending",
-            )
-            db.add(source)
-            count += 1
+        count = add_new_items(db, parsed_data)
         
         try:
             db.commit()
+            invalidate("content")
             logger.info(f"💾 Saved {count} new items to DB")
             return count
         except Exception as e:
             logger.error(f"❌ DB Save error: {e}")
             db.rollback()
             return 0
-
@@ -0,0 +1,184 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from instagrapi.exceptions import PleaseWaitFewMinutes, ClientThrottledError, RateLimitError, LoginRequired
+from parser.instagram_parser import InstagramParser
+
+logger = logging.getLogger(__name__)
+
+# Ответы Instagram, после которых сессию нужно "остудить"
+THROTTLE_ERRORS = (PleaseWaitFewMinutes, ClientThrottledError, RateLimitError)
+# Ошибки, после которых запрос стоит повторить (сессия в cool-down или перелогинена)
+RETRYABLE_ERRORS = THROTTLE_ERRORS + (LoginRequired,)
+
+# Как часто acquire проверяет событие отмены, пока ждет сессию
+CANCEL_POLL_SECS = 1.0
+
+
+class AcquireCancelled(Exception):
+    """Ожидание сессии прервано событием отмены (вызывающий уже останавливается)"""
+
+
+class TokenBucket:
+    """Бюджет запросов: capacity токенов, пополнение rate токенов в секунду"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_consume(self, tokens: float = 1.0) -> float:
+        """Списать токены. Возвращает 0, если получилось, иначе сколько секунд ждать"""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+
+class InstagramSession:
+    """Авторизованная сессия с собственным бюджетом запросов и cool-down"""
+
+    def __init__(self, parser: InstagramParser, bucket: TokenBucket, base_cooldown: float = 60.0):
+        self.parser = parser
+        self.bucket = bucket
+        self.base_cooldown = base_cooldown
+        self.cooldown_until = 0.0
+        self.throttle_streak = 0
+        self.busy = False
+
+    @property
+    def name(self) -> str:
+        return self.parser.username or "anonymous"
+
+    def cool_down(self):
+        """Экспоненциальный cool-down: 1, 2, 4... базовых интервала подряд"""
+        delay = min(self.base_cooldown * (2 ** self.throttle_streak), self.base_cooldown * 16)
+        self.throttle_streak += 1
+        self.cooldown_until = time.monotonic() + delay
+        logger.warning(f"🧊 Instagram session {self.name} throttled, cooling down for {delay:.0f}s")
+
+    def mark_ok(self):
+        self.throttle_streak = 0
+
+    def relogin(self):
+        """
+        Сессия протухла (LoginRequired): логинимся заново. Без учетных данных
+        или при неудачном входе уводим сессию в cool-down, чтобы запросы ушли другим.
+        """
+        if not (self.parser.username and self.parser.password):
+            self.cool_down()
+            return
+        try:
+            self.parser._login()
+            logger.info(f"🔑 Instagram session {self.name} logged in again")
+        except Exception as e:
+            logger.error(f"❌ Instagram re-login failed for {self.name}: {e}")
+            self.cool_down()
+
+
+class SessionPool:
+    """Пул сессий Instagram: выдает свободную сессию, у которой есть бюджет"""
+
+    def __init__(self, sessions: list[InstagramSession]):
+        if not sessions:
+            raise ValueError("SessionPool requires at least one session")
+        self.sessions = sessions
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @classmethod
+    def from_env(cls, sessions_dir: str = None, requests_per_minute: float = None, burst: float = None):
+        """
+        Собрать пул из INSTAGRAM_ACCOUNTS="user1:pass1,user2:pass2"
+        (или одиночных INSTAGRAM_USERNAME/INSTAGRAM_PASSWORD).
+        Сессия каждого аккаунта хранится в отдельном файле.
+        """
+        sessions_dir = sessions_dir or os.getenv("INSTAGRAM_SESSIONS_DIR", "storage/sessions")
+        rpm = requests_per_minute or float(os.getenv("INSTAGRAM_REQUESTS_PER_MINUTE", "20"))
+        burst = burst or float(os.getenv("INSTAGRAM_REQUEST_BURST", "5"))
+
+        credentials = []
+        for pair in filter(None, os.getenv("INSTAGRAM_ACCOUNTS", "").split(",")):
+            username, _, password = pair.strip().partition(":")
+            credentials.append((username, password))
+        if not credentials:
+            credentials.append((os.getenv("INSTAGRAM_USERNAME"), os.getenv("INSTAGRAM_PASSWORD")))
+
+        sessions = []
+        for username, password in credentials:
+            session_path = os.path.join(sessions_dir, f"instagram_{username or 'anonymous'}.json")
+            parser = InstagramParser(username=username, password=password, session_path=session_path)
+            sessions.append(InstagramSession(parser, TokenBucket(capacity=burst, rate=rpm / 60.0)))
+        logger.info(f"✅ Instagram session pool ready: {len(sessions)} session(s)")
+        return cls(sessions)
+
+    def acquire(self, timeout: float = None, cancel: threading.Event = None) -> InstagramSession:
+        """
+        Дождаться свободной сессии вне cool-down и списать с нее один запрос.
+        Если передан cancel, ожидание прерывается AcquireCancelled в течение
+        CANCEL_POLL_SECS после его установки.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise AcquireCancelled()
+                now = time.monotonic()
+                wait = None
+                for session in self.sessions:
+                    if session.busy:
+                        continue
+                    if session.cooldown_until > now:
+                        delay = session.cooldown_until - now
+                    else:
+                        delay = session.bucket.try_consume()
+                        if delay == 0:
+                            session.busy = True
+                            return session
+                    wait = delay if wait is None else min(wait, delay)
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise TimeoutError("No Instagram session available")
+                    wait = remaining if wait is None else min(wait, remaining)
+                if cancel is not None:
+                    wait = CANCEL_POLL_SECS if wait is None else min(wait, CANCEL_POLL_SECS)
+                # wait=None: все сессии заняты, ждем release()
+                self._cond.wait(timeout=wait)
+
+    def release(self, session: InstagramSession):
+        with self._cond:
+            session.busy = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def session(self, timeout: float = None, cancel: threading.Event = None):
+        """
+        Выдать сессию; при throttling-ответе отправить ее в cool-down,
+        при LoginRequired перелогинить. Исключение пробрасывается — запрос
+        повторяет вызывающий (см. RETRYABLE_ERRORS).
+        """
+        session = self.acquire(timeout=timeout, cancel=cancel)
+        try:
+            yield session
+            session.mark_ok()
+        except THROTTLE_ERRORS:
+            session.cool_down()
+            raise
+        except LoginRequired:
+            session.relogin()
+            raise
+        finally:
+            self.release(session)
@@ -1,113 +1,72 @@
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
+from PIL import Image
+from renderer.templates import load_template, get_layout
 import os
-import json
+import time
 import zipfile
+import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Профили экспорта слайдов: формат, расширение, параметры Image.save
+# и число цветов палитры (для PNG с квантованием)
+EXPORT_PROFILES = {
+    # Как раньше: PNG с настройками Pillow по умолчанию
+    "png": {"format": "PNG", "ext": "png", "save": {}},
+    # Палитровый PNG: градиент и текст укладываются в 256 цветов без заметных потерь
+    "png_palette": {"format": "PNG", "ext": "png", "palette": 256, "save": {"optimize": True}},
+    "jpeg": {"format": "JPEG", "ext": "jpg",
+             "save": {"quality": 90, "optimize": True, "progressive": True, "subsampling": 0}},
+    "webp": {"format": "WEBP", "ext": "webp", "save": {"quality": 90, "method": 4}},
+}
+
 class CarouselRenderer:
-    def __init__(self, theme="dark"):
-        self.width = 1080
-        self.height = 1350
+    def __init__(self, theme="dark", scale=1.0):
+        # Макеты, цвета и шрифты описаны в renderer/templates/<theme>.json
         self.theme = theme
-        self.themes = {
-            "dark": {
-                "bg_start": "#1a1a1a", 
-                "bg_end": "#2d0b31", # Темно-фиолетовый градиент в стиле WB
-                "text": "#ffffff", 
-                "accent": "#cb11ab", # Розовый WB
-                "muted": "#a0a0a0"
-            },
-            "light": {
-                "bg_start": "#ffffff", 
-                "bg_end": "#f0f0f0", 
-                "text": "#000000", 
-                "accent": "#cb11ab",
-                "muted": "#666666"
-            }
-        }
-        self.colors = self.themes.get(theme, self.themes["dark"])
-        # Пути к системным шрифтам с поддержкой кириллицы
-        self.font_bold = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-        self.font_regular = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-
-    def _draw_gradient(self, draw):
-        """Рисует мягкий градиент на фоне"""
-        for i in range(self.height):
-            # Интерполяция цвета от bg_start до bg_end
-            r1, g1, b1 = self._hex_to_rgb(self.colors["bg_start"])
-            r2, g2, b2 = self._hex_to_rgb(self.colors["bg_end"])
-            
-            r = int(r1 + (r2 - r1) * (i / self.height))
-            g = int(g1 + (g2 - g1) * (i / self.height))
-            b = int(b1 + (b2 - b1) * (i / self.height))
-            
-            draw.line([(0, i), (self.width, i)], fill=(r, g, b))
+        self.scale = scale
+        self.template = load_template(theme)
+        self.colors = self.template["colors"]
+        self.width = round(self.template["size"][0] * scale)
+        self.height = round(self.template["size"][1] * scale)
 
-    def _hex_to_rgb(self, hex_color):
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    def warm_up(self):
+        """Скомпилировать статичные слои всех типов слайдов заранее"""
+        for slide_type in self.template["layouts"]:
+            get_layout(self.theme, slide_type, self.scale)
 
-    def create_slide(self, slide_data, output_path):
+    def create_slide(self, slide_data, output_path, profile="png"):
         """Создать один стильный слайд"""
-        img = Image.new('RGB', (self.width, self.height))
-        draw = ImageDraw.Draw(img)
-        
-        # 1. Фон
-        self._draw_gradient(draw)
-        
-        # 2. Шрифты
-        try:
-            font_h1 = ImageFont.truetype(self.font_bold, size=80)
-            font_h2 = ImageFont.truetype(self.font_bold, size=60)
-            font_body = ImageFont.truetype(self.font_regular, size=45)
-            font_footer = ImageFont.truetype(self.font_regular, size=30)
-        except:
-            font_h1 = font_h2 = font_body = font_footer = ImageFont.load_default()
-
-        margin = 100
-        content_width = self.width - 2 * margin
-
-        # 3. Декор (полоска сверху)
-        draw.rectangle([margin, 50, margin + 150, 60], fill=self.colors["accent"])
-
-        # 4. Заголовок (Headline)
-        headline = slide_data.get("headline", "").upper()
-        if headline:
-            wrapped_h1 = textwrap.wrap(headline, width=18)
-            y_text = 150
-            for line in wrapped_h1:
-                draw.text((margin, y_text), line, font=font_h1, fill=self.colors["text"])
-                y_text += 100
-        else:
-            y_text = 150
+        img = self.render_slide(slide_data)
+        self.save_image(img, output_path, profile)
+        return output_path
 
-        # 5. Основной текст (Body)
-        body = slide_data.get("body_text", "")
-        if body:
-            y_text += 50
-            # Рисуем разделитель
-            draw.line([margin, y_text, margin + 100, y_text], fill=self.colors["accent"], width=3)
-            y_text += 50
-            
-            wrapped_body = textwrap.wrap(body, width=35)
-            for line in wrapped_body:
-                draw.text((margin, y_text), line, font=font_body, fill=self.colors["text"])
-                y_text += 60
-            
-        # 6. Футер
-        # Номер слайда
-        slide_num = f"{slide_data.get('number', 1)}"
-        draw.text((self.width - margin - 50, self.height - margin), slide_num, font=font_h2, fill=self.colors["accent"])
-        
-        # Брендинг
-        draw.text((margin, self.height - margin), "CONTENT FACTORY | WILDBERRIES", font=font_footer, fill=self.colors["muted"])
+    def save_image(self, img, output_path, profile="png") -> int:
+        """Закодировать слайд по профилю экспорта. Возвращает размер файла в байтах"""
+        settings = EXPORT_PROFILES[profile]
+        if settings.get("palette"):
+            img = img.quantize(colors=settings["palette"], dither=Image.Dither.NONE)
+        img.save(output_path, format=settings["format"], **settings["save"])
+        return os.path.getsize(output_path)
 
-        img.save(output_path)
-        return output_path
+    def render_slide(self, slide_data):
+        """Отрисовать слайд в памяти (без кодирования в файл)"""
+        layout = get_layout(self.theme, slide_data.get("type"), self.scale)
+        return layout.render(slide_data)
 
-    def generate_carousel(self, plan: dict, output_dir: str):
+    def generate_carousel(self, plan: dict, output_dir: str, profile: str = "png", zip_level: int = None):
         """Сгенерировать всю карусель и упаковать в ZIP"""
+        return self.export_carousel(plan, output_dir, profile, zip_level)["zip_path"]
+
+    def export_carousel(self, plan: dict, output_dir: str, profile: str = "png", zip_level: int = None) -> dict:
+        """
+        Сгенерировать карусель в заданном профиле и вернуть отчет:
+        путь к ZIP, время отрисовки/кодирования и размеры.
+        zip_level=None — ZIP без сжатия (ZIP_STORED), 0-9 — ZIP_DEFLATED с этим уровнем.
+        """
+        if profile not in EXPORT_PROFILES:
+            raise ValueError(f"Unknown export profile: {profile}")
+        ext = EXPORT_PROFILES[profile]["ext"]
         os.makedirs(output_dir, exist_ok=True)
         
         # Папка для слайдов
@@ -116,21 +75,55 @@ class CarouselRenderer:
         os.makedirs(slides_dir, exist_ok=True)
         
         generated_files = []
+        render_secs = encode_secs = 0.0
+        images_bytes = 0
         
         # Генерация слайдов
         for slide in plan.get("slides", []):
-            filename = f"slide_{slide['number']}.png"
+            filename = f"slide_{slide['number']}.{ext}"
             filepath = os.path.join(slides_dir, filename)
-            self.create_slide(slide, filepath)
+            started = time.perf_counter()
+            img = self.render_slide(slide)
+            rendered = time.perf_counter()
+            images_bytes += self.save_image(img, filepath, profile)
+            encode_secs += time.perf_counter() - rendered
+            render_secs += rendered - started
             generated_files.append(filepath)
             
         # Создание ZIP
         zip_filename = f"{carousel_id}.zip"
         zip_path = os.path.join(output_dir, zip_filename)
         
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
+        started = time.perf_counter()
+        if zip_level is None:
+            zipf = zipfile.ZipFile(zip_path, 'w')
+        else:
+            zipf = zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=zip_level)
+        with zipf:
             for file in generated_files:
                 zipf.write(file, os.path.basename(file))
-                
-        return zip_path
+        zip_secs = time.perf_counter() - started
+
+        report = {
+            "profile": profile,
+            "zip_level": zip_level,
+            "slides": len(generated_files),
+            "render_secs": round(render_secs, 3),
+            "encode_secs": round(encode_secs, 3),
+            "zip_secs": round(zip_secs, 3),
+            "images_bytes": images_bytes,
+            "zip_bytes": os.path.getsize(zip_path),
+            "zip_path": zip_path,
+        }
+        logger.info(
+            f"🖼️ Carousel exported [{profile}]: {report['slides']} slides, "
+            f"encode {report['encode_secs']}s, zip {report['zip_bytes'] / 1024:.0f} KB"
+        )
+        return report
 
+    def compare_profiles(self, plan: dict, output_dir: str, profiles: list = None, zip_level: int = None) -> list[dict]:
+        """Экспортировать план во всех профилях и вернуть отчеты для сравнения CPU/размера"""
+        reports = []
+        for profile in profiles or EXPORT_PROFILES:
+            reports.append(self.export_carousel(plan, os.path.join(output_dir, profile), profile, zip_level))
+        return reports
@@ -0,0 +1,97 @@
+"""
+Сервис быстрых превью каруселей внутри процесса API.
+
+Шрифты и статичные слои шаблонов прогреваются при старте, слайды рендерятся
+в уменьшенном масштабе в ограниченном пуле потоков и кодируются в WebP.
+Недавние превью хранятся в LRU-кэше, поэтому повторный запрос того же плана
+(например, при переключении вкладок в редакторе) не рендерится заново.
+"""
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from renderer.carousel_generator import CarouselRenderer
+from renderer.templates import available_templates
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewOverloaded(Exception):
+    """Все слоты рендера заняты — лучше сразу ответить 503, чем копить очередь"""
+
+
+class PreviewService:
+    def __init__(self, max_workers: int = None, cache_size: int = None, scale: float = None,
+                 quality: int = 70, max_pending: int = None):
+        self.max_workers = max_workers or int(os.getenv("PREVIEW_WORKERS", "2"))
+        self.cache_size = cache_size or int(os.getenv("PREVIEW_CACHE_SIZE", "64"))
+        self.scale = scale or float(os.getenv("PREVIEW_SCALE", "0.4"))
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="preview")
+        # Ограничение одновременных запросов превью (каждый — пачка слайдов)
+        self._slots = threading.BoundedSemaphore(max_pending or self.max_workers * 4)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def warm_up(self):
+        """Прогреть шрифты и статичные слои всех шаблонов в масштабе превью"""
+        started = time.perf_counter()
+        for theme in available_templates():
+            CarouselRenderer(theme=theme, scale=self.scale).warm_up()
+        logger.info(f"🔥 Preview service warmed up in {time.perf_counter() - started:.2f}s")
+
+    def _cache_key(self, structure: dict, theme: str) -> str:
+        raw = json.dumps({"s": structure.get("slides", []), "t": theme, "k": self.scale},
+                         sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str):
+        with self._cache_lock:
+            slides = self._cache.get(key)
+            if slides is not None:
+                self._cache.move_to_end(key)
+            return slides
+
+    def _cache_put(self, key: str, slides: list):
+        with self._cache_lock:
+            self._cache[key] = slides
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _render_slide(self, renderer: CarouselRenderer, slide: dict) -> bytes:
+        buf = io.BytesIO()
+        # method=0 — самый быстрый режим кодировщика WebP, для превью качества хватает
+        renderer.render_slide(slide).save(buf, format="WEBP", quality=self.quality, method=0)
+        return buf.getvalue()
+
+    def render(self, structure: dict, theme: str = "dark", timeout: float = 10.0) -> tuple[list[bytes], bool]:
+        """
+        Отрендерить слайды плана в WebP. Возвращает (слайды, из_кэша).
+        Блокирующий вызов: из async-кода вызывать через run_in_executor.
+        """
+        key = self._cache_key(structure, theme)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached, True
+
+        if not self._slots.acquire(timeout=timeout):
+            raise PreviewOverloaded("Preview render queue is full")
+        try:
+            renderer = CarouselRenderer(theme=theme, scale=self.scale)
+            futures = [self._executor.submit(self._render_slide, renderer, slide)
+                       for slide in structure.get("slides", [])]
+            slides = [future.result(timeout=timeout) for future in futures]
+        finally:
+            self._slots.release()
+
+        self._cache_put(key, slides)
+        return slides, False
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
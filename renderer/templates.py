@@ -0,0 +1,162 @@
+"""
+Декларативные шаблоны слайдов.
+
+Шаблон (renderer/templates/<theme>.json) описывает для каждого типа слайда
+(cover, content, cta) фон, статичные элементы и регионы с текстом из плана.
+Статичная часть компилируется один раз в готовое изображение и кэшируется,
+поэтому рендер слайда — это копия слоя плюс отрисовка текста.
+"""
+import os
+import json
+import textwrap
+import threading
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+TEMPLATES_DIR = os.getenv("CAROUSEL_TEMPLATES_DIR", os.path.join(os.path.dirname(__file__), "templates"))
+DEFAULT_LAYOUT = "content"
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+@lru_cache(maxsize=128)
+def load_font(path: str, size: int):
+    """Шрифты грузятся с диска один раз на процесс"""
+    try:
+        return ImageFont.truetype(path, size=size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=32)
+def load_template(name: str) -> dict:
+    # Тема приходит извне (API, сохраненный план): только имена из каталога шаблонов,
+    # иначе "../..." открыл бы произвольный .json на хосте
+    if name not in available_templates():
+        name = "dark"
+    with open(os.path.join(TEMPLATES_DIR, f"{name}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=1)
+def available_templates() -> tuple[str, ...]:
+    return tuple(sorted(f[:-5] for f in os.listdir(TEMPLATES_DIR) if f.endswith(".json")))
+
+
+def _hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+
+class CompiledLayout:
+    """Скомпилированный макет: статичный слой + регионы для текста (в пикселях с учетом масштаба)"""
+
+    def __init__(self, template: dict, layout_name: str, scale: float = 1.0):
+        layouts = template["layouts"]
+        layout = layouts.get(layout_name) or layouts[DEFAULT_LAYOUT]
+        self.colors = template["colors"]
+        self.fonts = template["fonts"]
+        self.scale = scale
+        self.width = round(template["size"][0] * scale)
+        self.height = round(template["size"][1] * scale)
+        self.static = self._compile_static(layout)
+        self.regions = [self._scale_region(region) for region in layout.get("regions", [])]
+
+    def _s(self, value):
+        return round(value * self.scale)
+
+    def color(self, value):
+        """Ссылка на цвет палитры шаблона или литерал #rrggbb"""
+        return self.colors.get(value, value)
+
+    def font(self, name: str, size: int):
+        return load_font(self.fonts.get(name, name), max(1, self._s(size)))
+
+    def _compile_static(self, layout: dict):
+        img = Image.new('RGB', (self.width, self.height), self.color(self.colors.get("bg_start", "#000000")))
+        draw = ImageDraw.Draw(img)
+
+        background = layout.get("background", {})
+        if background.get("type") == "gradient":
+            r1, g1, b1 = _hex_to_rgb(self.color(background["from"]))
+            r2, g2, b2 = _hex_to_rgb(self.color(background["to"]))
+            for i in range(self.height):
+                t = i / self.height
+                draw.line([(0, i), (self.width, i)],
+                          fill=(int(r1 + (r2 - r1) * t), int(g1 + (g2 - g1) * t), int(b1 + (b2 - b1) * t)))
+        elif background.get("type") == "solid":
+            draw.rectangle([0, 0, self.width, self.height], fill=self.color(background["fill"]))
+
+        for element in layout.get("static", []):
+            if element["type"] == "rect":
+                draw.rectangle([self._s(v) for v in element["box"]], fill=self.color(element["fill"]))
+            elif element["type"] == "line":
+                draw.line([self._s(v) for v in element["points"]], fill=self.color(element["fill"]),
+                          width=max(1, self._s(element.get("width", 1))))
+            elif element["type"] == "text":
+                draw.text([self._s(v) for v in element["xy"]], element["text"],
+                          font=self.font(element["font"], element["size"]), fill=self.color(element["fill"]))
+        return img
+
+    def _scale_region(self, region: dict) -> dict:
+        compiled = dict(region)
+        compiled["font"] = self.font(region["font"], region["size"])
+        compiled["fill"] = self.color(region["fill"])
+        if "xy" in region:
+            compiled["xy"] = [self._s(v) for v in region["xy"]]
+        compiled["gap"] = self._s(region.get("gap", 0))
+        compiled["line_height"] = self._s(region.get("line_height", region["size"]))
+        if "rule" in region:
+            rule = region["rule"]
+            compiled["rule"] = {
+                "length": self._s(rule["length"]),
+                "width": max(1, self._s(rule.get("width", 1))),
+                "fill": self.color(rule["fill"]),
+                "gap": self._s(rule.get("gap", 0)),
+            }
+        return compiled
+
+    def render(self, slide_data: dict):
+        """Слайд = копия статичного слоя + текст регионов"""
+        img = self.static.copy()
+        draw = ImageDraw.Draw(img)
+        x = y = 0
+        for region in self.regions:
+            value = slide_data.get(region["field"])
+            text = str(value) if value not in (None, "") else region.get("default", "")
+            if region.get("flow"):
+                # Регион идет следом за предыдущим; пустой регион место не занимает
+                if not text:
+                    continue
+                y += region["gap"]
+                if "rule" in region:
+                    rule = region["rule"]
+                    draw.line([x, y, x + rule["length"], y], fill=rule["fill"], width=rule["width"])
+                    y += rule["gap"]
+            else:
+                x, y = region["xy"]
+            if not text:
+                continue
+            if region.get("transform") == "upper":
+                text = text.upper()
+            lines = textwrap.wrap(text, width=region["wrap"]) if region.get("wrap") else [text]
+            for line in lines:
+                draw.text((x, y), line, font=region["font"], fill=region["fill"])
+                y += region["line_height"]
+        return img
+
+
+def get_layout(theme: str, slide_type: str, scale: float = 1.0) -> CompiledLayout:
+    """Скомпилированный макет из кэша процесса (компиляция — один раз на тему/тип/масштаб)"""
+    template = load_template(theme)
+    layout_name = slide_type if slide_type in template["layouts"] else DEFAULT_LAYOUT
+    key = (template["name"], layout_name, scale)
+    layout = _compiled.get(key)
+    if layout is None:
+        with _compiled_lock:
+            layout = _compiled.get(key)
+            if layout is None:
+                layout = CompiledLayout(template, layout_name, scale)
+                _compiled[key] = layout
+    return layout
@@ -14,6 +14,8 @@ type ContentItem = {
   caption: string;
   score: number | null;
   status: string;
+  likes: number | null;
+  views: number | null;
   metadata_info: any;
 };
 
@@ -124,8 +126,8 @@ export default function Content() {
                         <a href={item.url} target="_blank" rel="noreferrer" className="flex items-center gap-1 hover:text-primary">
                           <ExternalLink className="h-3 w-3" /> Источник
                         </a>
-                        {item.metadata_info?.views && <span>👁️ {item.metadata_info.views}</span>}
-                        {item.metadata_info?.likes && <span>❤️ {item.metadata_info.likes}</span>}
+                        {item.views != null && <span>👁️ {item.views}</span>}
+                        {item.likes != null && <span>❤️ {item.likes}</span>}
                       </div>
                     </div>
                     
@@ -134,7 +136,7 @@ export default function Content() {
                         <Star className="h-4 w-4 fill-yellow-500" />
                         {item.score || 0}
                       </div>
-                      {item.status !== "approved" && item.status !== "completed" && (
+                      {!["approved", "generating", "completed"].includes(item.status) && (
                         <Button size="sm" onClick={() => handleApprove(item.id)} className="gradient-primary">
                           <Sparkles className="h-4 w-4 mr-2" /> В работу
                         </Button>
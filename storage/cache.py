@@ -0,0 +1,86 @@
+"""
+Кэш ответов API в Redis.
+
+Инвалидация через "поколения": у каждого пространства имен (content, carousels, runs)
+есть счетчик, входящий в ключ. Запись в БД делает INCR счетчика, и все старые
+ключи пространства разом становятся недостижимыми (их добивает TTL).
+"""
+import os
+import json
+import hashlib
+import logging
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, redis_url: str = None, ttl: int = None, prefix: str = "respcache"):
+        self.redis = redis.Redis.from_url(
+            redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+        )
+        self.ttl = ttl or int(os.getenv("RESPONSE_CACHE_TTL", "60"))
+        self.prefix = prefix
+
+    def _generation_key(self, namespace: str) -> str:
+        return f"{self.prefix}:gen:{namespace}"
+
+    def key_for(self, namespace: str, params: dict) -> str | None:
+        """
+        Ключ текущего поколения. Вычисляется один раз до загрузки данных и
+        используется и для get, и для set: если запись инвалидирует кэш, пока
+        loader читает БД, результат ляжет под старое поколение и не будет отдан.
+        None — Redis недоступен.
+        """
+        try:
+            generation = int(self.redis.get(self._generation_key(namespace)) or 0)
+        except redis.RedisError as e:
+            logger.warning(f"⚠️ Response cache unavailable: {e}")
+            return None
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"{self.prefix}:{namespace}:{generation}:{digest}"
+
+    def get(self, key: str) -> tuple[str, bytes] | None:
+        """Вернуть (etag, body) или None. Недоступный Redis — это промах, а не ошибка"""
+        try:
+            value = self.redis.get(key)
+        except redis.RedisError as e:
+            logger.warning(f"⚠️ Response cache unavailable: {e}")
+            return None
+        if value is None:
+            return None
+        etag, _, body = value.partition(b"\n")
+        return etag.decode(), body
+
+    def set(self, key: str, etag: str, body: bytes):
+        try:
+            self.redis.set(key, etag.encode() + b"\n" + body, ex=self.ttl)
+        except redis.RedisError as e:
+            logger.warning(f"⚠️ Response cache unavailable: {e}")
+
+    def invalidate(self, *namespaces: str):
+        try:
+            pipe = self.redis.pipeline()
+            for namespace in namespaces:
+                pipe.incr(self._generation_key(namespace))
+            pipe.execute()
+        except redis.RedisError as e:
+            # Не роняем запись в БД из-за кэша: устаревший ответ доживет максимум ttl
+            logger.warning(f"⚠️ Response cache invalidation failed: {e}")
+
+
+_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+def invalidate(*namespaces: str):
+    """Сбросить закэшированные ответы API после записи (вызывается из задач и API)"""
+    get_response_cache().invalidate(*namespaces)
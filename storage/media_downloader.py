@@ -0,0 +1,176 @@
+import os
+import re
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import httpx
+from sqlalchemy.orm import Session
+from database.models import ContentSource
+
+logger = logging.getLogger(__name__)
+
+# (тип медиа, ключи с прямой ссылкой в метаданных парсера/Apify, подпапка, расширение)
+MEDIA_KINDS = (
+    ("video", ("video_url", "videoUrl"), "videos", "mp4"),
+    ("thumbnail", ("thumbnail_url", "displayUrl"), "thumbnails", "jpg"),
+)
+
+# Статусы после одобрения: генерация переводит запись в generating, затем в completed
+MEDIA_STATUSES = ("approved", "generating", "completed")
+
+
+def media_id_for(source: ContentSource) -> str:
+    """Стабильный идентификатор медиа: pk Instagram, id Apify или id записи"""
+    meta = source.raw_item
+    media_id = meta.get("pk") or meta.get("id") or meta.get("shortCode") or f"cs{source.id}"
+    return re.sub(r"[^A-Za-z0-9_-]", "_", str(media_id))
+
+
+def resolve_with_ytdlp(page_url: str) -> str | None:
+    """Получить прямую ссылку на видео со страницы поста через yt-dlp (без скачивания)"""
+    import yt_dlp
+    try:
+        with yt_dlp.YoutubeDL({"quiet": True, "skip_download": True, "format": "mp4/best"}) as ydl:
+            info = ydl.extract_info(page_url, download=False)
+            return info.get("url")
+    except Exception as e:
+        logger.error(f"❌ yt-dlp could not resolve {page_url}: {e}")
+        return None
+
+
+class MediaDownloader:
+    """
+    Загрузчик медиа для одобренного контента.
+
+    - файлы качаются потоково кусками по chunk_size во временный .part;
+    - оборванная загрузка продолжается через HTTP Range;
+    - на каждый хост свой httpx.Client с ограниченным пулом соединений;
+    - общее число параллельных загрузок ограничено max_workers;
+    - результат кэшируется по media id (на диске и, опционально, в S3),
+      поэтому повторный запрос не делает ни одного HTTP-вызова.
+    """
+
+    def __init__(self, root_dir: str = None, s3=None, max_workers: int = 4,
+                 per_host_connections: int = 2, chunk_size: int = 1024 * 1024,
+                 timeout: float = 60.0, max_attempts: int = 3, resolver=resolve_with_ytdlp):
+        self.root_dir = root_dir or os.getenv("MEDIA_ROOT", "storage")
+        self.s3 = s3
+        self.per_host_connections = per_host_connections
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.resolver = resolver
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media")
+        self._clients = {}
+        self._media_locks = {}
+        self._lock = threading.Lock()
+
+    def _client_for(self, url: str) -> httpx.Client:
+        host = urlsplit(url).netloc
+        with self._lock:
+            client = self._clients.get(host)
+            if client is None:
+                client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=self.per_host_connections,
+                        max_keepalive_connections=self.per_host_connections,
+                    ),
+                    # pool=None: при занятом пуле ждем соединение, а не падаем
+                    timeout=httpx.Timeout(self.timeout, pool=None),
+                    follow_redirects=True,
+                )
+                self._clients[host] = client
+            return client
+
+    def _media_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._media_locks.setdefault(key, threading.Lock())
+
+    def path_for(self, media_id: str, subdir: str, ext: str) -> str:
+        return os.path.join(self.root_dir, subdir, f"{media_id}.{ext}")
+
+    def _stream_to_file(self, url: str, path: str):
+        part_path = f"{path}.part"
+        for attempt in range(1, self.max_attempts + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                with self._client_for(url).stream("GET", url, headers=headers) as response:
+                    if response.status_code == 416:
+                        # Сервер говорит, что запрошенный диапазон за концом файла: .part уже полный
+                        break
+                    response.raise_for_status()
+                    # 200 на Range-запрос — сервер не умеет докачку, пишем заново
+                    mode = "ab" if response.status_code == 206 else "wb"
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_bytes(self.chunk_size):
+                            f.write(chunk)
+                break
+            except httpx.TransportError as e:
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning(f"⚠️ Download of {url} interrupted ({e}), resuming ({attempt}/{self.max_attempts})")
+        os.replace(part_path, path)
+
+    def download(self, media_id: str, url: str, subdir: str = "videos", ext: str = "mp4") -> str:
+        """Скачать один файл (или вернуть закэшированный). Возвращает путь или ключ в S3"""
+        path = self.path_for(media_id, subdir, ext)
+        object_key = f"media/{subdir}/{media_id}.{ext}"
+
+        with self._media_lock(path):
+            if self.s3 is not None and self.s3.exists(object_key):
+                return object_key
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                logger.info(f"⬇️ Downloading {media_id} from {urlsplit(url).netloc}")
+                self._stream_to_file(url, path)
+            if self.s3 is None:
+                return path
+            self.s3.upload_file(path, object_key)
+            os.remove(path)
+            return object_key
+
+    def _jobs_for(self, source: ContentSource) -> list[tuple]:
+        meta = source.raw_item
+        media_id = media_id_for(source)
+        jobs = []
+        for kind, keys, subdir, ext in MEDIA_KINDS:
+            url = next((meta[k] for k in keys if meta.get(k)), None)
+            if url is None and kind == "video" and self.resolver and source.media_type == "reel":
+                url = self.resolver(source.url)
+            if url:
+                jobs.append((kind, media_id, url, subdir, ext))
+        return jobs
+
+    def download_sources(self, db: Session, source_ids: list[int]) -> dict:
+        """
+        Скачать медиа для указанных записей. Обрабатываются только одобренные
+        (status из MEDIA_STATUSES), остальные пропускаются. Возвращает {source_id: {kind: путь | "error: ..."}}.
+        """
+        sources = (
+            db.query(ContentSource)
+            .filter(ContentSource.id.in_(source_ids), ContentSource.status.in_(MEDIA_STATUSES))
+            .all()
+        )
+        futures = {}
+        for source in sources:
+            for kind, media_id, url, subdir, ext in self._jobs_for(source):
+                future = self._executor.submit(self.download, media_id, url, subdir, ext)
+                futures[(source.id, kind)] = future
+
+        results = {source.id: {} for source in sources}
+        for (source_id, kind), future in futures.items():
+            try:
+                results[source_id][kind] = future.result()
+            except Exception as e:
+                logger.error(f"❌ Media download failed for source {source_id} ({kind}): {e}")
+                results[source_id][kind] = f"error: {e}"
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
@@ -0,0 +1,77 @@
+import os
+import logging
+import boto3
+from botocore.config import Config
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+def create_s3_client(endpoint: str = None, max_pool_connections: int = 10):
+    """
+    Создать boto3-клиент для MinIO. Клиент потокобезопасен и держит
+    собственный пул HTTP-соединений, поэтому его стоит переиспользовать.
+    """
+    endpoint = endpoint or os.getenv("MINIO_ENDPOINT", "localhost:9000")
+    if not endpoint.startswith("http"):
+        endpoint = f"http://{endpoint}"
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=os.getenv("MINIO_ACCESS_KEY") or os.getenv("MINIO_ROOT_USER"),
+        aws_secret_access_key=os.getenv("MINIO_SECRET_KEY") or os.getenv("MINIO_ROOT_PASSWORD"),
+        region_name="us-east-1",
+        config=Config(
+            signature_version="s3v4",
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": 3, "mode": "standard"},
+        ),
+    )
+
+
+class S3Storage:
+    def __init__(self, client=None, bucket: str = None):
+        self.bucket = bucket or os.getenv("MINIO_BUCKET", "artifacts")
+        self.client = client or create_s3_client()
+        self.external_url = os.getenv("MINIO_EXTERNAL_URL")
+        self._presign_client = None
+        self._bucket_checked = False
+
+    def ensure_bucket(self):
+        """Создать бакет, если его еще нет (проверяется один раз на экземпляр)"""
+        if self._bucket_checked:
+            return
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except Exception:
+            logger.info(f"🪣 Creating bucket {self.bucket}")
+            self.client.create_bucket(Bucket=self.bucket)
+        self._bucket_checked = True
+
+    def upload_file(self, file_path: str, object_key: str) -> str:
+        self.ensure_bucket()
+        self.client.upload_file(file_path, self.bucket, object_key)
+        logger.info(f"☁️ Uploaded {file_path} -> s3://{self.bucket}/{object_key}")
+        return object_key
+
+    def exists(self, object_key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=object_key)
+            return True
+        except Exception:
+            return False
+
+    def get_presigned_url(self, object_key: str, expires_in: int = 3600) -> str:
+        # Внутри docker-сети endpoint другой, чем снаружи, а хост входит в подпись,
+        # поэтому ссылку подписываем клиентом с внешним адресом (без сетевых вызовов)
+        client = self.client
+        if self.external_url:
+            if self._presign_client is None:
+                self._presign_client = create_s3_client(self.external_url, max_pool_connections=1)
+            client = self._presign_client
+        return client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": object_key},
+            ExpiresIn=expires_in,
+        )
@@ -1,73 +1,192 @@
 from celery_app import celery_app
-from integrations.apify.client import ApifyWrapper
+from tasks.resources import get_apify
 from database.init_db import SessionLocal
-from database.models import PipelineRun, Account
-from datetime import datetime
+from tasks.runs import CHECKPOINTED_TASK, claim_run, get_checkpoint, save_checkpoint, complete_run, fail_or_retry
+from database.models import Account, ContentSource
+from sqlalchemy import func
 import logging
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task
-def discovery_accounts(run_id: int, config: dict):
+# Вес связи из графа (отметка/упоминание в посте) относительно попадания в поисковый запрос
+GRAPH_EDGE_WEIGHT = 0.5
+
+
+def _merge_hits(candidates: dict, results: list, query: str):
+    """Добавить результаты поиска в пул кандидатов (дедуп по username)"""
+    for item in results:
+        # Маппинг данных из Apify
+        username = (item.get("username") or "").lower()
+        if not username: continue
+        candidate = candidates.setdefault(username, {"queries": [], "edges": 0, "followers": None})
+        if query not in candidate["queries"]:
+            candidate["queries"].append(query)
+        if item.get("followersCount") is not None:
+            candidate["followers"] = item["followersCount"]
+
+
+def _rank(candidates: dict) -> list[str]:
+    """Сначала пересечение запросов и связи в графе, затем подписчики"""
+    def key(username):
+        c = candidates[username]
+        return (len(c["queries"]) + GRAPH_EDGE_WEIGHT * c["edges"], c["followers"] or 0)
+    return sorted(candidates, key=key, reverse=True)
+
+
+def _linked_usernames(item: dict) -> list[str]:
+    """Аккаунты, связанные с постом: отметки, соавторы, упоминания"""
+    linked = []
+    for key in ("taggedUsers", "coauthorProducers"):
+        for user in item.get(key) or []:
+            if isinstance(user, dict) and user.get("username"):
+                linked.append(user["username"])
+    linked.extend(m for m in item.get("mentions") or [] if isinstance(m, str))
+    return [u.lstrip("@").lower() for u in linked]
+
+
+def _expand_graph(db, candidates: dict, frontier: list[str], hops: int, per_hop: int, posts_per_hop: int) -> int:
+    """
+    Расширить пул по уже собранным постам (без вызовов скрапера): от аккаунтов
+    фронтира идем к отмеченным/упомянутым ими аккаунтам, не более hops шагов.
+    Возвращает количество новых кандидатов.
+    """
+    added = 0
+    for hop in range(hops):
+        if not frontier:
+            break
+        posts = (
+            db.query(ContentSource)
+            .filter(ContentSource.author.in_(frontier))
+            .order_by(ContentSource.id.desc())
+            .limit(posts_per_hop)
+            .all()
+        )
+        discovered = {}
+        for post in posts:
+            author = (post.author or "").lower()
+            for username in _linked_usernames(post.raw_item):
+                if username == author:
+                    continue
+                if username in candidates:
+                    candidates[username]["edges"] += 1
+                else:
+                    discovered[username] = discovered.get(username, 0) + 1
+
+        for username, edges in discovered.items():
+            candidates[username] = {"queries": [], "edges": edges, "followers": None, "hop": hop + 1}
+        added += len(discovered)
+        frontier = sorted(discovered, key=discovered.get, reverse=True)[:per_hop]
+    return added
+
+
+@celery_app.task(**CHECKPOINTED_TASK)
+def discovery_accounts(self, run_id: int, config: dict):
     db = SessionLocal()
-    run = db.query(PipelineRun).filter(PipelineRun.id == run_id).first()
+    run = claim_run(db, run_id)
     if not run:
-        return "Run not found"
-
-    run.status = "running"
-    run.started_at = datetime.utcnow()
-    db.commit()
+        db.close()
+        return "Run not found or already started"
 
     try:
-        apify = ApifyWrapper()
+        apify = get_apify()
+        checkpoint = get_checkpoint(run)
+        done_queries = set(checkpoint.get("done_queries", []))
+        # Кандидаты копятся в памяти (и в чекпоинте), в БД пишутся один раз в конце
+        candidates = checkpoint.get("candidates", {})
+        found = checkpoint.get("found", 0)
         
         # Конфигурация для Instagram Search Scraper (например, apify/instagram-search-scraper)
         # В реальности нужно использовать правильный ID актора
         actor_id = config.get("actor_id", "apify/instagram-search-scraper")
         search_queries = config.get("queries", ["wildberries", "бизнес на вб"])
         
-        all_results = []
+        # 1. Поиск: собираем попадания по всем запросам
         for query in search_queries:
+            if query in done_queries:
+                continue
             input_data = {
                 "search": query,
                 "searchType": "user",
                 "resultsLimit": config.get("limit_per_query", 10)
             }
             results = apify.run_actor_sync(actor_id, input_data)
-            if results:
-                all_results.extend(results)
+            if results is None:
+                raise RuntimeError(f"Apify actor {actor_id} failed for query '{query}'")
+
+            _merge_hits(candidates, results, query)
+            found += len(results)
+            done_queries.add(query)
+            save_checkpoint(db, run, done_queries=sorted(done_queries), candidates=candidates, found=found)
+
+        # 2. Расширение графа от лучших кандидатов по уже собранным постам
+        expanded = checkpoint.get("expanded")
+        if expanded is None:
+            per_hop = config.get("expand_top", 10)
+            expanded = _expand_graph(
+                db, candidates, _rank(candidates)[:per_hop],
+                hops=min(config.get("expand_hops", 1), 3),
+                per_hop=per_hop,
+                posts_per_hop=config.get("expand_posts_limit", 500),
+            )
+            save_checkpoint(db, run, candidates=candidates, expanded=expanded)
 
+        # 3. Обогащение: один батчевый вызов актора профилей на весь топ
+        enrich_limit = config.get("enrich_limit", 50)
+        top = _rank(candidates)[:enrich_limit]
+        enriched = 0
+        if top and config.get("enrich", True):
+            profiles = apify.run_actor_sync(
+                config.get("profile_actor_id", "apify/instagram-profile-scraper"),
+                {"usernames": top},
+            )
+            if profiles is None:
+                raise RuntimeError("Apify profile enrichment failed")
+            for profile in profiles:
+                candidate = candidates.get((profile.get("username") or "").lower())
+                if candidate is None: continue
+                candidate["followers"] = profile.get("followersCount", candidate["followers"])
+                candidate["private"] = bool(profile.get("private") or profile.get("isPrivate"))
+                enriched += 1
+
+        # 4. Сохраняем ранжированный топ одним проходом
+        min_followers = config.get("min_followers", 0)
+        ranked = [
+            u for u in _rank(candidates)[:enrich_limit]
+            if not candidates[u].get("private") and (candidates[u]["followers"] or 0) >= min_followers
+        ]
+        # Старый код сохранял username как есть, поэтому сравниваем без учета регистра
+        existing = {
+            acc.username.lower(): acc
+            for acc in db.query(Account).filter(func.lower(Account.username).in_(ranked))
+        }
         saved_count = 0
-        for item in all_results:
-            # Маппинг данных из Apify в модель Account
-            username = item.get("username")
-            if not username: continue
-            
-            existing = db.query(Account).filter(Account.username == username).first()
-            if not existing:
-                account = Account(
-                    username=username,
-                    platform="instagram",
-                    followers=item.get("followersCount"),
-                    category="candidate",
-                    is_active=True
-                )
-                db.add(account)
-                saved_count += 1
-        
+        for username in ranked:
+            followers = candidates[username]["followers"]
+            account = existing.get(username)
+            if account:
+                if followers is not None:
+                    account.followers = followers
+                continue
+            db.add(Account(
+                username=username,
+                platform="instagram",
+                followers=followers,
+                category="candidate",
+                is_active=True
+            ))
+            saved_count += 1
         db.commit()
         
-        run.status = "completed"
-        run.stats = {"found": len(all_results), "saved": saved_count}
-        run.finished_at = datetime.utcnow()
-        db.commit()
+        complete_run(db, run, {
+            "found": found,
+            "candidates": len(candidates),
+            "expanded": expanded,
+            "enriched": enriched,
+            "saved": saved_count,
+        })
         
     except Exception as e:
         logger.error(f"Discovery task error: {e}")
-        run.status = "failed"
-        run.error_log = str(e)
-        run.finished_at = datetime.utcnow()
-        db.commit()
+        fail_or_retry(db, run, self, e)
     finally:
         db.close()
-
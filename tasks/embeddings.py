@@ -0,0 +1,60 @@
+from celery_app import celery_app
+from database.init_db import SessionLocal
+from database.models import ContentSource
+from tasks.resources import get_embedding_provider, get_vector_index
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+def embed_pending(db, provider, index, ids: list[int] = None, batch_size: int = 256,
+                  max_batches: int = None) -> int:
+    """
+    Дописать в индекс строки с embedded_at IS NULL (только из ids, если переданы)
+    и отметить их. Отбор по флагу, а не по id > max_id: id выдаются
+    последовательностью, но коммитятся не по порядку (харвест пишет
+    кусками, скоринг — пачками), и меньший id может появиться позже большего.
+    Возвращает количество добавленных в индекс.
+    """
+    embedded = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        query = db.query(ContentSource.id, ContentSource.caption).filter(ContentSource.embedded_at.is_(None))
+        if ids is not None:
+            query = query.filter(ContentSource.id.in_(ids))
+        rows = query.order_by(ContentSource.id).limit(batch_size).all()
+        if not rows:
+            break
+        row_ids = [row_id for row_id, _ in rows]
+        # Уже проиндексированные строки (до появления embedded_at или параллельным
+        # запуском) только отмечаем, не тратя вызов провайдера
+        index.reload()
+        todo = [(row_id, caption) for row_id, caption in rows if index.position_of(row_id) is None]
+        if todo:
+            vectors = provider.embed([caption or "" for _, caption in todo])
+            embedded += index.append([row_id for row_id, _ in todo], vectors)
+        db.query(ContentSource).filter(ContentSource.id.in_(row_ids)).update(
+            {"embedded_at": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        batches += 1
+    return embedded
+
+
+@celery_app.task(ignore_result=True)
+def embed_new_content(batch_size: int = 256, max_batches: int = 40):
+    """
+    Инкрементально посчитать эмбеддинги подписей для строк, которых еще нет
+    в индексе (embedded_at IS NULL).
+    """
+    provider = get_embedding_provider()
+    index = get_vector_index()
+    db = SessionLocal()
+    try:
+        embedded = embed_pending(db, provider, index, batch_size=batch_size, max_batches=max_batches)
+    finally:
+        db.close()
+
+    if embedded:
+        logger.info(f"🧭 Embedded {embedded} captions (index size {index.count})")
+    return embedded
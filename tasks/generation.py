@@ -1,9 +1,8 @@
 from celery_app import celery_app
 from database.init_db import SessionLocal
 from database.models import ContentSource, CarouselPlan, Carousel
-from analyzer.analyzer import ContentAnalyzer
-from renderer.carousel_generator import CarouselRenderer
-from storage.s3 import S3Storage
+from tasks.resources import get_analyzer, get_renderer, get_s3
+from storage.cache import invalidate
 from datetime import datetime
 import logging
 import os
@@ -11,6 +10,18 @@ import shutil
 
 logger = logging.getLogger(__name__)
 
+# Профиль экспорта слайдов (см. renderer.carousel_generator.EXPORT_PROFILES)
+EXPORT_PROFILE = os.getenv("CAROUSEL_EXPORT_PROFILE", "png_palette")
+ZIP_LEVEL = int(os.getenv("CAROUSEL_ZIP_LEVEL")) if os.getenv("CAROUSEL_ZIP_LEVEL") else None
+
+def _release_source(db, content_source_id: int):
+    """Генерация не удалась: вернуть источник в approved, чтобы его можно было запустить снова"""
+    db.query(ContentSource).filter(
+        ContentSource.id == content_source_id, ContentSource.status == "generating"
+    ).update({"status": "approved"}, synchronize_session=False)
+    db.commit()
+    invalidate("content")
+
 @celery_app.task
 def generate_carousel_pipeline(content_source_id: int):
     """
@@ -21,14 +32,24 @@ def generate_carousel_pipeline(content_source_id: int):
     """
     db = SessionLocal()
     try:
+        # Атомарно забираем источник approved -> generating до вызова OpenAI:
+        # повторная доставка из outbox (в т.ч. пока первая еще работает) ничего не найдет
+        claimed = (
+            db.query(ContentSource)
+            .filter(ContentSource.id == content_source_id, ContentSource.status == "approved")
+            .update({"status": "generating"}, synchronize_session=False)
+        )
+        db.commit()
+        if not claimed:
+            return "Source not found or already generating"
         source = db.query(ContentSource).filter(ContentSource.id == content_source_id).first()
-        if not source:
-            return "Source not found"
+        invalidate("content")
 
         # 1. Repurpose
-        analyzer = ContentAnalyzer()
+        analyzer = get_analyzer()
         plan_data = analyzer.generate_carousel_plan(source)
         if not plan_data:
+            _release_source(db, content_source_id)
             return "Failed to generate plan"
 
         plan = CarouselPlan(
@@ -42,14 +63,15 @@ def generate_carousel_pipeline(content_source_id: int):
         db.refresh(plan)
 
         # 2. Render & Package
-        renderer = CarouselRenderer()
+        renderer = get_renderer(plan.theme or "dark")
         temp_output_dir = f"storage/temp/{plan.id}"
         os.makedirs(temp_output_dir, exist_ok=True)
         
-        zip_path = renderer.generate_carousel(plan_data, temp_output_dir)
+        report = renderer.export_carousel(plan_data, temp_output_dir, profile=EXPORT_PROFILE, zip_level=ZIP_LEVEL)
+        zip_path = report["zip_path"]
         
         # 3. Upload to S3
-        s3 = S3Storage()
+        s3 = get_s3()
         object_key = f"carousels/carousel_{plan.id}.zip"
         s3.upload_file(zip_path, object_key)
         
@@ -64,6 +86,7 @@ def generate_carousel_pipeline(content_source_id: int):
         # Обновляем статус источника
         source.status = "completed"
         db.commit()
+        invalidate("content", "carousels")
 
         # Очистка временных файлов
         if os.path.exists(temp_output_dir):
@@ -75,6 +98,8 @@ def generate_carousel_pipeline(content_source_id: int):
         
     except Exception as e:
         logger.error(f"Generation pipeline error: {e}")
+        db.rollback()
+        _release_source(db, content_source_id)
         return str(e)
     finally:
         db.close()
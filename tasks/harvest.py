@@ -1,83 +1,103 @@
 from celery_app import celery_app
-from integrations.apify.client import ApifyWrapper
+from tasks.resources import get_apify
 from database.init_db import SessionLocal
-from database.models import PipelineRun, Account, ContentSource
+from tasks.runs import CHECKPOINTED_TASK, claim_run, get_checkpoint, save_checkpoint, complete_run, fail_or_retry
+from database.models import Account, ContentSource
+from database.ingest import new_content_source
+from storage.cache import invalidate
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task
-def harvest_instagram_content(run_id: int, config: dict):
+@celery_app.task(**CHECKPOINTED_TASK)
+def harvest_instagram_content(self, run_id: int, config: dict):
     db = SessionLocal()
-    run = db.query(PipelineRun).filter(PipelineRun.id == run_id).first()
+    run = claim_run(db, run_id)
     if not run:
-        return "Run not found"
-
-    run.status = "running"
-    run.started_at = datetime.utcnow()
-    db.commit()
+        db.close()
+        return "Run not found or already started"
 
     try:
-        apify = ApifyWrapper()
+        apify = get_apify()
+        checkpoint = get_checkpoint(run)
         
-        # Берем топ аккаунтов для парсинга
-        accounts = db.query(Account).filter(Account.is_active == True).limit(config.get("accounts_limit", 5)).all()
-        if not accounts:
-            run.status = "completed"
-            run.stats = {"message": "No active accounts to harvest"}
-            run.finished_at = datetime.utcnow()
-            db.commit()
-            return
+        # Аккаунты фиксируются в чекпоинте, чтобы ретрай парсил тот же набор
+        account_ids = checkpoint.get("account_ids")
+        if account_ids is None:
+            # Берем топ аккаунтов для парсинга
+            accounts = db.query(Account).filter(Account.is_active == True).limit(config.get("accounts_limit", 5)).all()
+            if not accounts:
+                complete_run(db, run, {"message": "No active accounts to harvest"})
+                return
+            account_ids = [acc.id for acc in accounts]
+            checkpoint = save_checkpoint(db, run, account_ids=account_ids)
+        accounts = db.query(Account).filter(Account.id.in_(account_ids)).all()
 
         usernames = [acc.username for acc in accounts]
         
-        # Конфигурация для Instagram Scraper (например, apify/instagram-scraper)
-        actor_id = config.get("actor_id", "apify/instagram-scraper")
-        input_data = {
-            "directUrls": [f"https://www.instagram.com/{u}/" for u in usernames],
-            "resultsLimit": config.get("posts_per_profile", 10),
-            "resultsType": "posts"
-        }
-        
-        results = apify.run_actor_sync(actor_id, input_data)
-        
-        saved_count = 0
-        if results:
+        # Запуск актора сохраняется в чекпоинт: после падения воркера дожидаемся
+        # того же run в Apify, а не платим за новый
+        apify_run_id = checkpoint.get("apify_run_id")
+        if not apify_run_id:
+            # Конфигурация для Instagram Scraper (например, apify/instagram-scraper)
+            actor_id = config.get("actor_id", "apify/instagram-scraper")
+            input_data = {
+                "directUrls": [f"https://www.instagram.com/{u}/" for u in usernames],
+                "resultsLimit": config.get("posts_per_profile", 10),
+                "resultsType": "posts"
+            }
+            apify_run_id = apify.run_actor_async(actor_id, input_data)
+            if not apify_run_id:
+                raise RuntimeError(f"Failed to start Apify actor {actor_id}")
+            checkpoint = save_checkpoint(db, run, apify_run_id=apify_run_id, processed=0, saved=0)
+
+        apify_run = apify.wait_for_run(apify_run_id, wait_secs=config.get("wait_secs", 300))
+        if not apify_run or apify_run.get("status") != "SUCCEEDED":
+            status = apify_run.get("status") if apify_run else "UNKNOWN"
+            if status in ("FAILED", "ABORTED", "TIMED-OUT"):
+                # Мертвый run не ждем повторно: ретрай запустит актор заново
+                save_checkpoint(db, run, apify_run_id=None, processed=0, saved=0)
+            raise RuntimeError(f"Apify run {apify_run_id} not finished: {status}")
+        dataset_id = apify_run.get("defaultDatasetId")
+
+        # Датасет читаем кусками, каждый кусок коммитится вместе со смещением
+        chunk_size = config.get("chunk_size", 100)
+        processed = checkpoint.get("processed", 0)
+        saved_count = checkpoint.get("saved", 0)
+        while True:
+            results = apify.get_dataset_items(dataset_id, offset=processed, limit=chunk_size)
+            if results is None:
+                # Смещение уже в чекпоинте: ретрай продолжит с processed
+                raise RuntimeError(f"Failed to read dataset {dataset_id} at offset {processed}")
+            if not results:
+                break
+
+            urls = {item.get("url") for item in results if item.get("url")}
+            existing = {url for (url,) in db.query(ContentSource.url).filter(ContentSource.url.in_(urls))}
             for item in results:
                 url = item.get("url")
-                if not url: continue
+                if not url or url in existing: continue
+                existing.add(url)
                 
-                existing = db.query(ContentSource).filter(ContentSource.url == url).first()
-                if not existing:
-                    source = ContentSource(
-                        url=url,
-                        platform="instagram",
-                        caption=item.get("caption", ""),
-                        metadata_info=item,
-                        status="pending"
-                    )
-                    db.add(source)
-                    saved_count += 1
-            
-            db.commit()
-            
-            # Обновляем время последнего парсинга у аккаунтов
-            for acc in accounts:
-                acc.last_parsed_at = datetime.utcnow()
-            db.commit()
+                db.add(new_content_source(item, url=url, platform="instagram", caption=item.get("caption", "")))
+                saved_count += 1
 
-        run.status = "completed"
-        run.stats = {"found": len(results) if results else 0, "saved": saved_count}
-        run.finished_at = datetime.utcnow()
+            processed += len(results)
+            save_checkpoint(db, run, processed=processed, saved=saved_count)
+            invalidate("content")
+            if len(results) < chunk_size:
+                break
+            
+        # Обновляем время последнего парсинга у аккаунтов
+        for acc in accounts:
+            acc.last_parsed_at = datetime.utcnow()
         db.commit()
+
+        complete_run(db, run, {"found": processed, "saved": saved_count})
         
     except Exception as e:
         logger.error(f"Harvest task error: {e}")
-        run.status = "failed"
-        run.error_log = str(e)
-        run.finished_at = datetime.utcnow()
-        db.commit()
+        fail_or_retry(db, run, self, e)
     finally:
         db.close()
-
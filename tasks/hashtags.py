@@ -0,0 +1,41 @@
+from celery_app import celery_app
+from tasks.resources import get_instagram_pool
+from parser.hashtag_harvester import MultiHashtagHarvester
+from database.init_db import SessionLocal
+from tasks.runs import CHECKPOINTED_TASK, claim_run, get_checkpoint, save_checkpoint, complete_run, fail_or_retry
+import logging
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task(**CHECKPOINTED_TASK)
+def harvest_hashtags(self, run_id: int, config: dict):
+    db = SessionLocal()
+    run = claim_run(db, run_id)
+    if not run:
+        db.close()
+        return "Run not found or already started"
+
+    try:
+        # Позиция по каждому хэштегу хранится в HashtagCursor, чекпоинт запуска
+        # только накапливает статистику между попытками
+        checkpoint = get_checkpoint(run)
+        hashtags = config.get("hashtags", ["wildberries", "вайлдберриз"])
+        harvester = MultiHashtagHarvester(
+            get_instagram_pool(),
+            page_size=config.get("page_size", 50),
+        )
+        stats = harvester.harvest(db, hashtags, amount_per_hashtag=config.get("amount_per_hashtag", 500))
+        stats["saved_total"] = checkpoint.get("saved_total", 0) + stats["saved"]
+        save_checkpoint(db, run, saved_total=stats["saved_total"])
+        if stats["hashtags"] and len(stats["errors"]) == len(stats["hashtags"]):
+            # Ни один хэштег не прошел (логин, бан сессий) — это сбой запуска, а не успех.
+            # Курсоры прерванных хэштегов сохранены, ретрай продолжит с них
+            raise RuntimeError(f"All hashtags failed: {stats['errors']}")
+
+        complete_run(db, run, stats)
+        
+    except Exception as e:
+        logger.error(f"Hashtag harvest task error: {e}")
+        fail_or_retry(db, run, self, e)
+    finally:
+        db.close()
@@ -0,0 +1,18 @@
+from celery_app import celery_app
+from tasks.resources import get_media_downloader
+from database.init_db import SessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task
+def download_source_media(source_ids: list[int]):
+    """Скачать видео и обложки для одобренных источников (по запросу)"""
+    db = SessionLocal()
+    try:
+        results = get_media_downloader().download_sources(db, source_ids)
+        logger.info(f"✅ Media ready for {len(results)} sources")
+        # Ключи JSON-результата Celery должны быть строками
+        return {str(source_id): files for source_id, files in results.items()}
+    finally:
+        db.close()
@@ -0,0 +1,73 @@
+from celery_app import celery_app
+from database.init_db import SessionLocal
+from database.models import DispatchOutbox
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task(ignore_result=True)
+def relay_outbox(batch_size: int = 100, max_batches: int = 20):
+    """
+    Переслать ожидающие записи outbox в брокер пачками.
+    FOR UPDATE SKIP LOCKED позволяет нескольким релеям работать параллельно
+    без двойной отправки одной и той же пачки. Гарантия — at-least-once:
+    если воркер упадет после send_task, но до коммита, задача уйдет повторно
+    с тем же task_id, а сама задача это переживет (идемпотентна).
+    """
+    db = SessionLocal()
+    sent = 0
+    try:
+        for _ in range(max_batches):
+            entries = (
+                db.query(DispatchOutbox)
+                .filter(DispatchOutbox.status == "pending")
+                .order_by(DispatchOutbox.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not entries:
+                break
+
+            broker_failed = False
+            for entry in entries:
+                try:
+                    celery_app.send_task(entry.task_name, args=entry.args, task_id=entry.idempotency_key)
+                    entry.status = "sent"
+                    entry.dispatched_at = datetime.utcnow()
+                    sent += 1
+                except Exception as e:
+                    entry.attempts = (entry.attempts or 0) + 1
+                    entry.last_error = str(e)
+                    logger.error(f"❌ Outbox dispatch of {entry.task_name} failed: {e}")
+                    # Брокер недоступен — нет смысла долбить его остатком пачки
+                    broker_failed = True
+                    break
+            db.commit()
+
+            if broker_failed or len(entries) < batch_size:
+                break
+    finally:
+        db.close()
+
+    if sent:
+        logger.info(f"📤 Relayed {sent} outbox tasks")
+    return sent
+
+@celery_app.task(ignore_result=True)
+def purge_outbox(keep_hours: int = 24):
+    """Удалить давно отправленные записи outbox"""
+    db = SessionLocal()
+    try:
+        threshold = datetime.utcnow() - timedelta(hours=keep_hours)
+        deleted = (
+            db.query(DispatchOutbox)
+            .filter(DispatchOutbox.status == "sent", DispatchOutbox.dispatched_at < threshold)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        logger.info(f"🧹 Purged {deleted} outbox entries")
+        return deleted
+    finally:
+        db.close()
@@ -0,0 +1,144 @@
+"""
+Реестр долгоживущих ресурсов воркера.
+
+Клиенты (Apify, OpenAI, S3, Instagram) создаются один раз на процесс воркера
+в обработчике сигнала `worker_process_init` и переиспользуются всеми задачами:
+TLS-рукопожатия, пулы соединений и логин в Instagram больше не повторяются
+на каждый вызов задачи.
+"""
+import os
+import threading
+import logging
+import httpx
+from openai import OpenAI
+from integrations.apify.client import ApifyWrapper
+from analyzer.analyzer import ContentAnalyzer
+from renderer.carousel_generator import CarouselRenderer
+from storage.s3 import S3Storage, create_s3_client
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_SIZE = int(os.getenv("WORKER_HTTP_POOL_SIZE", "10"))
+INSTAGRAM_SESSION_PATH = os.getenv("INSTAGRAM_SESSION_PATH", "storage/sessions/instagram.json")
+
+_lock = threading.RLock()
+_resources = {}
+
+
+def _get_or_create(key, factory):
+    """Потокобезопасное ленивое создание ресурса (double-checked locking)"""
+    resource = _resources.get(key)
+    if resource is not None:
+        return resource
+    with _lock:
+        resource = _resources.get(key)
+        if resource is None:
+            resource = factory()
+            _resources[key] = resource
+        return resource
+
+
+def get_apify() -> ApifyWrapper:
+    return _get_or_create("apify", ApifyWrapper)
+
+
+def get_analyzer() -> ContentAnalyzer:
+    def factory():
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+        return ContentAnalyzer(client=client)
+
+    return _get_or_create("analyzer", factory)
+
+
+def get_renderer(theme: str = "dark") -> CarouselRenderer:
+    return _get_or_create(f"renderer:{theme}", lambda: CarouselRenderer(theme=theme))
+
+
+def get_s3() -> S3Storage:
+    return _get_or_create("s3", lambda: S3Storage(client=create_s3_client(max_pool_connections=HTTP_POOL_SIZE)))
+
+
+def get_media_downloader():
+    from storage.media_downloader import MediaDownloader
+
+    def factory():
+        s3 = get_s3() if os.getenv("MEDIA_UPLOAD_TO_S3", "false").lower() == "true" else None
+        return MediaDownloader(s3=s3, max_workers=int(os.getenv("MEDIA_DOWNLOAD_CONCURRENCY", "4")))
+
+    return _get_or_create("media_downloader", factory)
+
+
+def get_embedding_provider():
+    from analyzer.embeddings import get_embedding_provider as create_provider
+
+    def factory():
+        if os.getenv("EMBEDDINGS_PROVIDER", "openai") == "openai":
+            # Переиспользуем пул соединений анализатора
+            return create_provider(client=get_analyzer().client)
+        return create_provider()
+
+    return _get_or_create("embeddings", factory)
+
+
+def get_vector_index():
+    from analyzer.vector_index import VectorIndex
+
+    def factory():
+        return VectorIndex(provider=get_embedding_provider().name)
+
+    index = _get_or_create("vector_index", factory)
+    index.reload()
+    return index
+
+
+def get_instagram_parser():
+    # instagrapi тяжелый и нужен не каждому воркеру, поэтому импорт ленивый
+    from parser.instagram_parser import InstagramParser
+    return _get_or_create("instagram", lambda: InstagramParser(session_path=INSTAGRAM_SESSION_PATH))
+
+
+def get_instagram_pool():
+    """Пул авторизованных сессий Instagram для параллельного сбора хэштегов"""
+    from parser.session_pool import SessionPool
+    return _get_or_create("instagram_pool", SessionPool.from_env)
+
+
+def init_worker_resources(**kwargs):
+    """
+    Обработчик `worker_process_init`: прогреваем клиенты в каждом дочернем процессе.
+    Создание после fork обязательно — сокеты пулов нельзя делить между процессами.
+    """
+    _resources.clear()
+    for name, getter in (("apify", get_apify), ("analyzer", get_analyzer), ("s3", get_s3)):
+        try:
+            getter()
+        except Exception as e:
+            # Не роняем воркер: ресурс будет создан лениво при первом обращении
+            logger.error(f"❌ Failed to init worker resource {name}: {e}")
+    logger.info("✅ Worker resources initialized")
+
+
+def shutdown_worker_resources(**kwargs):
+    """Обработчик `worker_process_shutdown`: сохраняем сессию и закрываем пулы"""
+    with _lock:
+        parsers = []
+        if _resources.get("instagram") is not None:
+            parsers.append(_resources["instagram"])
+        if _resources.get("instagram_pool") is not None:
+            parsers.extend(session.parser for session in _resources["instagram_pool"].sessions)
+        for parser in parsers:
+            try:
+                parser.dump_session()
+            except Exception as e:
+                logger.error(f"❌ Failed to dump Instagram session: {e}")
+        downloader = _resources.get("media_downloader")
+        if downloader is not None:
+            downloader.close()
+        analyzer = _resources.get("analyzer")
+        if analyzer is not None:
+            analyzer.client.close()
+        _resources.clear()
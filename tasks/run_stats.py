@@ -0,0 +1,111 @@
+from celery_app import celery_app
+from database.init_db import SessionLocal
+from database.models import PipelineRun, PipelineRunRollup
+from datetime import datetime, timedelta
+from sqlalchemy import func, text, null
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_BUCKETS = ("hour", "day")
+# Через сколько дней у запусков очищаются тяжелые поля и когда они удаляются совсем
+RUNS_COMPACT_AFTER_DAYS = int(os.getenv("RUNS_COMPACT_AFTER_DAYS", "7"))
+RUNS_DELETE_AFTER_DAYS = int(os.getenv("RUNS_DELETE_AFTER_DAYS", "90"))
+
+# Агрегация завершенных запусков по интервалам; :bucket — 'hour' или 'day'
+ROLLUP_SQL = text("""
+    SELECT date_trunc(:bucket, finished_at) AS bucket_start,
+           type,
+           count(*) AS runs,
+           count(*) FILTER (WHERE status = 'completed') AS completed,
+           count(*) FILTER (WHERE status = 'failed') AS failed,
+           coalesce(sum(coalesce((stats->>'saved')::int, (stats->>'scored')::int, 0))
+                    FILTER (WHERE status = 'completed'), 0) AS items,
+           avg(extract(epoch FROM finished_at - started_at)) AS duration_avg,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM finished_at - started_at)) AS duration_p50,
+           percentile_cont(0.9) WITHIN GROUP (ORDER BY extract(epoch FROM finished_at - started_at)) AS duration_p90,
+           percentile_cont(0.99) WITHIN GROUP (ORDER BY extract(epoch FROM finished_at - started_at)) AS duration_p99
+    FROM pipeline_runs
+    WHERE finished_at >= :since AND date_trunc(:bucket, finished_at) = ANY(:buckets)
+    GROUP BY 1, 2
+""")
+
+
+def _trunc(value: datetime, bucket: str) -> datetime:
+    if bucket == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+@celery_app.task(ignore_result=True)
+def refresh_run_rollups():
+    """
+    Инкрементально пересчитать роллапы: только интервалы, в которых есть запуски,
+    изменившиеся после прошлого пересчета. Водяной знак — max(refreshed_at).
+    """
+    db = SessionLocal()
+    try:
+        started = datetime.utcnow()
+        watermark = db.query(func.max(PipelineRunRollup.refreshed_at)).scalar() or datetime(1970, 1, 1)
+        touched = [
+            finished_at for (finished_at,) in
+            db.query(PipelineRun.finished_at)
+            .filter(PipelineRun.updated_at >= watermark, PipelineRun.finished_at.isnot(None))
+        ]
+        if not touched:
+            return 0
+
+        refreshed = 0
+        for bucket in ROLLUP_BUCKETS:
+            buckets = sorted({_trunc(ts, bucket) for ts in touched})
+            rows = db.execute(ROLLUP_SQL, {"bucket": bucket, "since": buckets[0], "buckets": buckets}).mappings().all()
+            # Интервал пересчитывается целиком: старые строки заменяем новыми
+            db.query(PipelineRunRollup).filter(
+                PipelineRunRollup.bucket == bucket, PipelineRunRollup.bucket_start.in_(buckets)
+            ).delete(synchronize_session=False)
+            for row in rows:
+                db.add(PipelineRunRollup(bucket=bucket, refreshed_at=started, **row))
+            refreshed += len(rows)
+        db.commit()
+        logger.info(f"📊 Refreshed {refreshed} run rollups from {len(touched)} changed runs")
+        return refreshed
+    finally:
+        db.close()
+
+
+@celery_app.task(ignore_result=True)
+def compact_runs():
+    """
+    Ретеншн журнала запусков: у старых запусков очищаем config_snapshot,
+    checkpoint и error_log (агрегаты уже в роллапах), совсем старые удаляем.
+    updated_at не меняем, чтобы не вызывать лишний пересчет роллапов.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        # Сначала досчитываем роллапы, чтобы удаляемые запуски в них уже были
+        refresh_run_rollups()
+        compacted = (
+            db.query(PipelineRun)
+            .filter(
+                PipelineRun.finished_at < now - timedelta(days=RUNS_COMPACT_AFTER_DAYS),
+                PipelineRun.config_snapshot.isnot(None),
+            )
+            .update(
+                # null() — SQL NULL, а не JSON 'null', иначе фильтр выше их не отсеет
+                {"config_snapshot": null(), "checkpoint": null(), "error_log": None,
+                 "updated_at": PipelineRun.updated_at},
+                synchronize_session=False,
+            )
+        )
+        deleted = (
+            db.query(PipelineRun)
+            .filter(PipelineRun.finished_at < now - timedelta(days=RUNS_DELETE_AFTER_DAYS))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        logger.info(f"🧹 Runs retention: compacted {compacted}, deleted {deleted}")
+        return {"compacted": compacted, "deleted": deleted}
+    finally:
+        db.close()
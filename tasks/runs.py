@@ -0,0 +1,100 @@
+from database.models import PipelineRun
+from storage.cache import invalidate
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Запуск в статусе running без обновлений дольше этого считается брошенным
+# (воркер умер), и повторная доставка задачи может его подхватить
+RUN_STALE_AFTER = int(os.getenv("RUN_STALE_AFTER_SECS", "600"))
+
+# Общие опции задач пайплайна: подтверждение после выполнения
+# и автоматические ретраи с продолжением с чекпоинта
+CHECKPOINTED_TASK = dict(
+    bind=True,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(Exception,),
+    max_retries=3,
+    retry_backoff=30,
+    retry_backoff_max=600,
+    retry_jitter=True,
+)
+
+
+def claim_run(db, run_id: int) -> PipelineRun | None:
+    """
+    Атомарно перевести запуск в running.
+    Берутся новые (pending), ожидающие ретрая (retrying) и брошенные running-запуски.
+    Возвращает None, если запуск не найден или уже выполняется другой доставкой
+    той же задачи (outbox гарантирует at-least-once, дубли возможны).
+    """
+    now = datetime.utcnow()
+    claimed = (
+        db.query(PipelineRun)
+        .filter(
+            PipelineRun.id == run_id,
+            or_(
+                PipelineRun.status.in_(["pending", "retrying"]),
+                and_(PipelineRun.status == "running",
+                     PipelineRun.updated_at < now - timedelta(seconds=RUN_STALE_AFTER)),
+            ),
+        )
+        .update({"status": "running", "updated_at": now}, synchronize_session=False)
+    )
+    db.commit()
+    invalidate("runs")
+    if not claimed:
+        logger.info(f"⏭️ Run {run_id} not found or already taken, skipping duplicate delivery")
+        return None
+    run = db.query(PipelineRun).filter(PipelineRun.id == run_id).first()
+    if run.started_at is None or not run.checkpoint:
+        run.started_at = now
+        db.commit()
+    return run
+
+
+def get_checkpoint(run: PipelineRun) -> dict:
+    return dict(run.checkpoint or {})
+
+
+def save_checkpoint(db, run: PipelineRun, **updates) -> dict:
+    """
+    Обновить чекпоинт и закоммитить вместе со всем, что накопилось в сессии.
+    Словарь пересоздается, иначе SQLAlchemy не заметит изменение JSON-колонки.
+    """
+    checkpoint = get_checkpoint(run)
+    checkpoint.update(updates)
+    run.checkpoint = checkpoint
+    db.commit()
+    return checkpoint
+
+
+def complete_run(db, run: PipelineRun, stats: dict):
+    run.status = "completed"
+    run.stats = stats
+    run.finished_at = datetime.utcnow()
+    db.commit()
+    invalidate("runs")
+
+
+def fail_or_retry(db, run: PipelineRun, task, exc: Exception):
+    """
+    Обработать ошибку задачи: если ретраи остались — пометить запуск retrying
+    и пробросить исключение (его подхватит autoretry), иначе пометить failed.
+    Чекпоинт не трогаем: ретрай продолжит с него.
+    """
+    db.rollback()
+    run.error_log = str(exc)
+    if task.request.retries < task.max_retries:
+        run.status = "retrying"
+        db.commit()
+        invalidate("runs")
+        raise exc
+    run.status = "failed"
+    run.finished_at = datetime.utcnow()
+    db.commit()
+    invalidate("runs")
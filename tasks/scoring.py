@@ -1,52 +1,157 @@
 from celery_app import celery_app
 from database.init_db import SessionLocal
-from database.models import PipelineRun, ContentSource
-from analyzer.analyzer import ContentAnalyzer
-from datetime import datetime
+from database.outbox import enqueue_task
+from tasks.runs import CHECKPOINTED_TASK, claim_run, get_checkpoint, save_checkpoint, complete_run, fail_or_retry
+from database.models import ContentSource
+from tasks.resources import get_analyzer, get_embedding_provider, get_vector_index
+from tasks.embeddings import embed_pending
+from storage.cache import invalidate
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task
-def score_pending(run_id: int):
-    db = SessionLocal()
-    run = db.query(PipelineRun).filter(PipelineRun.id == run_id).first()
-    if not run:
-        return "Run not found"
 
-    run.status = "running"
-    run.started_at = datetime.utcnow()
+def claim_batch(db, owner: str, batch_size: int, lease_secs: int) -> list[ContentSource]:
+    """
+    Забрать пачку элементов под аренду. SKIP LOCKED пропускает строки, которые
+    в этот момент забирает другой воркер, поэтому параллельные воркеры не пересекаются.
+    Просроченная аренда (воркер умер) подхватывается автоматически.
+    """
+    now = datetime.utcnow()
+    ids = [
+        item_id for (item_id,) in
+        db.query(ContentSource.id)
+        .filter(or_(
+            and_(ContentSource.status == "pending",
+                 or_(ContentSource.lease_expires_at.is_(None), ContentSource.lease_expires_at < now)),
+            and_(ContentSource.status == "scoring", ContentSource.lease_expires_at < now),
+        ))
+        .order_by(ContentSource.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ]
+    if ids:
+        db.query(ContentSource).filter(ContentSource.id.in_(ids)).update(
+            {"status": "scoring", "lease_owner": owner, "lease_expires_at": now + timedelta(seconds=lease_secs)},
+            synchronize_session=False,
+        )
     db.commit()
+    if not ids:
+        return []
+    return db.query(ContentSource).filter(ContentSource.id.in_(ids)).order_by(ContentSource.id).all()
+
+
+def _finish_item(db, item_id: int, owner: str, values: dict) -> bool:
+    """
+    Записать результат, только если аренда все еще наша и элемент все еще в скоринге:
+    одобренный за время аренды элемент не перезаписываем
+    """
+    return bool(
+        db.query(ContentSource)
+        .filter(ContentSource.id == item_id, ContentSource.lease_owner == owner,
+                ContentSource.status == "scoring")
+        .update({**values, "lease_owner": None}, synchronize_session=False)
+    )
+
+
+@celery_app.task(**CHECKPOINTED_TASK)
+def score_pending(self, run_id: int, config: dict = None):
+    """
+    Непрерывно разбирать очередь status='pending'. Задача работает в пределах
+    time_budget_secs, затем, если очередь не пуста, перепланирует сама себя
+    через outbox, чтобы не занимать воркер бесконечно.
+    """
+    config = config or {}
+    db = SessionLocal()
+    run = claim_run(db, run_id)
+    if not run:
+        db.close()
+        return "Run not found or already started"
 
     try:
-        analyzer = ContentAnalyzer()
-        
-        # Получаем контент со статусом pending
-        pending_items = db.query(ContentSource).filter(ContentSource.status == "pending").limit(50).all()
-        
-        scored_count = 0
-        for item in pending_items:
-            try:
-                score = analyzer.score_content(item)
-                item.score = score
-                item.status = "scored"
-                scored_count += 1
-            except Exception as e:
-                logger.error(f"Error scoring item {item.id}: {e}")
-
-        db.commit()
-        
-        run.status = "completed"
-        run.stats = {"scored": scored_count}
-        run.finished_at = datetime.utcnow()
-        db.commit()
+        analyzer = get_analyzer()
+        checkpoint = get_checkpoint(run)
+        scored_count = checkpoint.get("scored", 0)
+        failed_count = checkpoint.get("failed", 0)
+        limit = config.get("limit")  # None — до опустошения очереди
+        batch_size = config.get("batch_size", 10)
+        lease_secs = config.get("lease_secs", 300)
+        retry_delay_secs = config.get("retry_delay_secs", 600)
+        # Штраф за повтор уже известных тем: score *= 1 - w * (1 - novelty)
+        novelty_weight = config.get("novelty_weight", 0.0)
+        try:
+            index = get_vector_index()
+            provider = get_embedding_provider()
+        except Exception as e:
+            logger.warning(f"⚠️ Vector index unavailable, novelty disabled: {e}")
+            index = None
+        deadline = time.monotonic() + config.get("time_budget_secs", 240)
+        owner = f"{self.request.hostname}:{self.request.id}"
+
+        drained = False
+        while time.monotonic() < deadline:
+            remaining = None if limit is None else limit - scored_count - failed_count
+            if remaining is not None and remaining <= 0:
+                drained = True
+                break
+            batch = claim_batch(db, owner, batch_size if remaining is None else min(batch_size, remaining), lease_secs)
+            if not batch:
+                drained = True
+                break
+
+            if index is not None and config.get("embed_on_demand", True):
+                # Свежие элементы обычно еще не в индексе (он пополняется раз в 10 минут):
+                # дописываем пачку сейчас, чтобы посчитать novelty
+                try:
+                    embed_pending(db, provider, index, ids=[item.id for item in batch])
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"⚠️ On-demand embedding failed, novelty skipped: {e}")
+
+            batch_failed = 0
+            for item in batch:
+                try:
+                    score = analyzer.score_content(item)
+                    novelty = index.novelty(item.id) if index is not None else None
+                    if novelty is not None:
+                        score *= 1 - novelty_weight * (1 - novelty)
+                    _finish_item(db, item.id, owner, {"score": score, "novelty": novelty,
+                                                      "status": "scored", "lease_expires_at": None})
+                    scored_count += 1
+                except Exception as e:
+                    logger.error(f"Error scoring item {item.id}: {e}")
+                    # Возвращаем в очередь, но не раньше чем через retry_delay_secs
+                    _finish_item(db, item.id, owner, {
+                        "status": "pending",
+                        "lease_expires_at": datetime.utcnow() + timedelta(seconds=retry_delay_secs),
+                    })
+                    failed_count += 1
+                    batch_failed += 1
+
+            # Каждая пачка коммитится вместе с чекпоинтом
+            save_checkpoint(db, run, scored=scored_count, failed=failed_count)
+            invalidate("content")
+            if batch_failed == len(batch):
+                # Вся пачка упала (скорее всего недоступен API): не прогоняем
+                # через ошибку остаток очереди, а уходим в ретрай с бэкоффом
+                raise RuntimeError(f"All {batch_failed} items in batch failed to score")
+
+        if drained:
+            complete_run(db, run, {"scored": scored_count, "failed": failed_count})
+        else:
+            # Бюджет времени исчерпан: возвращаем запуск в очередь той же транзакцией
+            continuations = checkpoint.get("continuations", 0) + 1
+            run.status = "pending"
+            enqueue_task(db, "tasks.scoring.score_pending", [run.id, config],
+                         idempotency_key=f"run:{run.id}:{continuations}")
+            save_checkpoint(db, run, scored=scored_count, failed=failed_count, continuations=continuations)
+            logger.info(f"🔁 Scoring run {run.id} continues: {scored_count} scored so far")
         
     except Exception as e:
         logger.error(f"Scoring task error: {e}")
-        run.status = "failed"
-        run.error_log = str(e)
-        run.finished_at = datetime.utcnow()
-        db.commit()
+        fail_or_retry(db, run, self, e)
     finally:
         db.close()
-